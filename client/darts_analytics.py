@@ -1,60 +1,45 @@
-import collections
-import csv
-from datetime import datetime, timedelta
-from itertools import groupby
+from datetime import date, timedelta
 
 import cv2
-import math
 import numpy as np
-from dateutil import parser
 from matplotlib import pyplot as plt
 from pyheatmap.heatmap import HeatMap
 
 from server.classes import CalibrationData
+from server.dart_columns import load_columns
 from server.draw import draw_board
 
 
 def read_log():
-    darts_log = 'tmp/darts_log.csv'
-    with open(darts_log, 'r') as csv_file:
-        csv_reader = csv.DictReader(csv_file)
-        rows = [row for row in csv_reader]
-    return rows
+    return load_columns('tmp/darts_log.csv')
 
 
 def today(darts):
-    return [dart for dart in darts if parser.parse(dart['date']).date() == datetime.today().date()]
+    return darts.select(darts.day == np.datetime64(date.today()))
 
 
 def last_game(darts):
-    return [dart for dart in darts if dart['game_id'] == darts[-1]['game_id']]
+    return darts.select(darts.game == darts.game[-1])
 
 
 def last_n(darts, n):
-    return darts[-n:]
+    return darts.select(slice(-n, None))
 
 
 def new_setup(darts):
-    return [dart for dart in darts if parser.parse(dart['date']) >= parser.parse('2021-12-24')]
+    return darts.select(darts.date >= np.datetime64('2021-12-24'))
 
 
 def heatmap_per_day(darts):
-    correctly_detected_darts = [dart for dart in darts if dart['correctly_detected'] == 'True']
-    darts_per_day_iterator = groupby(correctly_detected_darts, key=lambda dart: parser.parse(dart['date']).date())
-    darts_per_day = {date: list(darts_of_day) for date, darts_of_day in darts_per_day_iterator}
-
-    x_dates = []
-    y_diff = []
-    y_avg = []
-
-    for date, darts in darts_per_day.items():
-        generate_heatmap(list(darts), name=str(date))
-        diff = sum([math.sqrt((400 - float(dart['loc_x']))**2 + (196 - float(dart['loc_y']))**2) for dart in darts]) / len(darts)
-        x_dates.append(date)
-        y_diff.append(diff)
-        print(date, diff)
-        avg = sum([int(dart['multiplier']) * int(dart['base']) for dart in darts]) / len(darts) * 3
-        y_avg.append(avg)
+    correctly_detected_darts = darts.select(darts.correctly_detected == 1)
+    x_dates, day_index = np.unique(correctly_detected_darts.day, return_inverse=True)
+    darts_per_day = np.bincount(day_index)
+    y_diff = np.bincount(day_index, np.hypot(400 - correctly_detected_darts.loc_x, 196 - correctly_detected_darts.loc_y)) / darts_per_day
+    y_avg = np.bincount(day_index, correctly_detected_darts.score) / darts_per_day * 3
+
+    for i, day in enumerate(x_dates):
+        generate_heatmap(correctly_detected_darts.select(day_index == i), name=str(day))
+        print(day, y_diff[i])
 
     plt.plot(x_dates, y_diff)
     plt.show()
@@ -85,47 +70,35 @@ def generate_map():
 
 
 def draw_dart(image, x, y):
-    cv2.circle(image, (int(float(x)), int(float(y))), 2, (0, 255, 0), 2, 8)
-    cv2.circle(image, (int(float(x)), int(float(y))), 6, (0, 255, 0), 1, 8)
+    cv2.circle(image, (int(x), int(y)), 2, (0, 255, 0), 2, 8)
+    cv2.circle(image, (int(x), int(y)), 6, (0, 255, 0), 1, 8)
 
 
 def count_scores(darts):
     print('\n\n### Scores Dict ###')
-    counter = collections.Counter()
-    for dart in darts:
-        score = int(dart['base']) * int(dart['multiplier'])
-        counter[score] += 1
-    print(dict(sorted(counter.items(), key=lambda item: item[1], reverse=True)))
+    scores, counts = np.unique(darts.score, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    print(dict(zip(scores[order].tolist(), counts[order].tolist())))
     print(len(darts))
 
 
 def average(darts):
     print('\n\n### Average ###')
-    my_sum = 0
-    for dart in darts:
-        my_sum += int(dart['base']) * int(dart['multiplier'])
-    avg = my_sum / len(darts)
-    print(avg * 3)
+    print(darts.score.mean() * 3)
 
 
 def draw_darts_map(darts):
     darts_map = generate_map()
-    for dart in darts:
-        draw_dart(darts_map, dart['loc_x'], dart['loc_y'])
+    located = np.isfinite(darts.loc_x) & np.isfinite(darts.loc_y)
+    for x, y in zip(darts.loc_x[located], darts.loc_y[located]):
+        draw_dart(darts_map, x, y)
     cv2.imwrite('../tmp/darts_map.jpg', darts_map)
 
 
 def correctly_detected(darts):
     print('\n\n### Correctly Detected ###')
-    counter = 0
-    correct = 0
-    for dart in darts:
-        cd = dart['correctly_detected']
-        if cd == 'True':
-            correct += 1
-            counter += 1
-        elif cd == 'False':
-            counter += 1
+    correct = np.count_nonzero(darts.correctly_detected == 1)
+    counter = np.count_nonzero(darts.correctly_detected >= 0)
     print('Correct:', correct)
     print('Total:', counter)
     print('Percent:', correct/counter)
@@ -133,25 +106,19 @@ def correctly_detected(darts):
 
 def calculate_playing_time(darts):
     print('\n\n### Playing Time ###')
-    total_playing_time = 0
-    first_dart_of_game = darts[0]
-    for idx, dart in enumerate(darts):
-        if dart['game_id'] != first_dart_of_game['game_id']:
-            # Calculate playing time of game
-            last_dart_of_game = darts[idx-1]
-            start_time_of_game = parser.parse(first_dart_of_game['date'])
-            end_time_of_game = parser.parse(last_dart_of_game['date'])
-            duration_of_game = (end_time_of_game - start_time_of_game).total_seconds()
-            total_playing_time += duration_of_game
-            # Start new game
-            first_dart_of_game = dart
-    print(timedelta(seconds=total_playing_time))
-    print(timedelta(seconds=(parser.parse(darts[-1]['date'])-parser.parse(darts[0]['date'])).total_seconds()).days)
-    print(timedelta(seconds=total_playing_time) / max(timedelta(seconds=(parser.parse(darts[-1]['date'])-parser.parse(darts[0]['date'])).total_seconds()).days, 1))
+    # a game lasts from its first to its last dart, the last game only counts once the next one started
+    game_starts = np.flatnonzero(darts.game[1:] != darts.game[:-1]) + 1
+    first_darts = np.concatenate(([0], game_starts[:-1]))
+    total_playing_time = timedelta(microseconds=int((darts.date[game_starts - 1] - darts.date[first_darts]).sum().astype(int)))
+    days = (darts.date[-1] - darts.date[0]).astype('timedelta64[D]').astype(int)
+    print(total_playing_time)
+    print(days)
+    print(total_playing_time / max(days, 1))
 
 
 def generate_heatmap(darts, name=''):
-    data = [(int(float(dart['loc_x'])), int(float(dart['loc_y']))) for dart in darts]
+    located = np.isfinite(darts.loc_x) & np.isfinite(darts.loc_y)
+    data = np.stack((darts.loc_x[located], darts.loc_y[located]), axis=1).astype(int).tolist()
     print(len(data))
 
     darts_map = generate_map()
@@ -166,7 +133,7 @@ def main(darts):
     darts = new_setup(darts)
 
     count_scores(last_game(darts))
-    count_scores(today([dart for dart in darts if dart['multiplier'] == '3']))
+    count_scores(today(darts.select(darts.multiplier == 3)))
     average(last_game(darts))
     average(today(darts))
     draw_darts_map(last_game(darts))
@@ -175,9 +142,9 @@ def main(darts):
     correctly_detected(darts)
     calculate_playing_time(today(darts))
     calculate_playing_time(darts)
-    count_scores(today([dart for dart in darts if int(dart['base']) in (5, 20, 1) and dart['correctly_detected'] == 'True']))
-    # draw_darts_map(today([dart for dart in darts if int(dart['base']) in (5, 20, 1) and dart['correctly_detected'] == 'True']))
-    generate_heatmap(last_game([dart for dart in darts if dart['correctly_detected'] == 'True']))  # if int(dart['base']) != 0 and
+    count_scores(today(darts.select(np.isin(darts.base, (5, 20, 1)) & (darts.correctly_detected == 1))))
+    # draw_darts_map(today(darts.select(np.isin(darts.base, (5, 20, 1)) & (darts.correctly_detected == 1))))
+    generate_heatmap(last_game(darts.select(darts.correctly_detected == 1)))  # & (darts.base != 0)
     draw_darts_map(darts)
     heatmap_per_day(read_log())
 
@@ -1,20 +1,22 @@
-import csv
-import os.path
-import uuid
-from datetime import datetime
 from threading import Thread
 from time import sleep
+from typing import Union
 from tkinter import *
 
 from game_modes import *
 from server.calibration import calibrate
-from server.classes import CalibrationData, Capture, Dart, GUIDef
-from server.darts_recognition import get_dart
+from server.classes import CalibrationData, CancellationToken, Capture, Dart, GUIDef
+from server.dart_log import DartLogWriter, dart_row
+from server.dart_store import DartStore, open_dart_log
+from server.darts_recognition import create_pipelines, get_fused_dart, wait_for_board_cleared
 from server.game import Game
-from server.video_capture import VideoStream
+from server.video_capture import CaptureGroup
+from server.visit_tracker import VisitTracker
 
-cam: VideoStream = VideoStream(src=1)
+cams: CaptureGroup = CaptureGroup([1])
 calibration_data: CalibrationData
+token: CancellationToken = CancellationToken()
+dart_log: Union[DartLogWriter, DartStore] = open_dart_log('tmp/darts_log.csv')
 
 
 def create_game():
@@ -52,16 +54,28 @@ def start_game():
 
 
 def game_loop():
-    cam.start()
+    global token
+    token = CancellationToken()
+    cams.start()
     sleep(1)  # time to init cam
+    pipelines = create_pipelines(cams, [calibration_data])
+    visit = VisitTracker(calibration_data)
+    # first dart of the next visit, thrown before the board was cleared
+    next_dart = None
 
     while not game.is_game_finished():
         game.get_current_player().captures.append(Capture())
         current_capture = game.get_current_player().captures[-1]
         round_complete = False
+        if next_dart is None:
+            visit.reset()
+        else:
+            current_capture.darts.append(next_dart)
+            update_entry_fields()
+            round_complete = game.is_capture_finished()
 
         while not round_complete and game.is_running:
-            dart = get_dart(cam, calibration_data)
+            dart = get_fused_dart(cams, pipelines, token, visit=visit)
             if not game.is_running:
                 return
             elif dart is None:
@@ -81,17 +95,16 @@ def game_loop():
         update_final_score_field()
 
         # time to correct score detection
-        # wait for player entering the zone
-        _ = get_dart(cam, calibration_data)
+        # next round starts as soon as the darts are pulled
+        next_dart = wait_for_board_cleared(cams, pipelines, token, visit=visit)
         if not game.is_running:
             return
 
         update_player_score()
         log_dart()
-        sleep(5)
 
         setup_next_round()
-    cam.stop()
+    cams.stop()
 
 
 def update_entry_fields():
@@ -149,32 +162,9 @@ def setup_next_round():
 
 
 def log_dart():
-    darts_log = 'tmp/darts_log.csv'
-
-    def generate_dict(dart):
-        return {
-            'id': uuid.uuid4(),
-            'date': datetime.now(),
-            'game_id': game.id,
-            'player_name': game.get_current_player().name,
-            'base': dart.base,
-            'multiplier': dart.multiplier,
-            'loc_x': dart.location[0],
-            'loc_y': dart.location[1],
-            'correctly_detected': str(dart.correctly_detected)
-        }
-
-    def write_csv(dart_dicts, header=False):
-        field_names = ['id', 'date', 'game_id', 'player_name', 'base', 'multiplier', 'loc_x', 'loc_y',
-                       'correctly_detected']
-        with open(darts_log, 'a') as csv_file:
-            csv_writer = csv.DictWriter(csv_file, field_names)
-            if header:
-                csv_writer.writeheader()
-            csv_writer.writerows(dart_dicts)
-
     current_capture = game.get_current_player().captures[-1]
-    write_csv([generate_dict(dart) for dart in current_capture.darts], header=(not os.path.isfile(darts_log)))
+    player_name = game.get_current_player().name
+    dart_log.write_rows([dart_row(dart, game_id=game.id, player_name=player_name) for dart in current_capture.darts])
 
 
 # correct dart score with binding -> press return to change
@@ -234,12 +224,14 @@ def stop_game():
     global game
     game.is_running = False
     game = None
-    cam.stop()
+    token.cancel()
+    cams.stop()
+    dart_log.close()
 
 
 def calibration_gui():
     global calibration_data
-    calibration_data = calibrate(cam)
+    calibration_data = calibrate(cams.streams[0])
 
 
 if __name__ == '__main__':
@@ -317,3 +309,4 @@ if __name__ == '__main__':
     app = Application(master=root)
     app.mainloop()
     root.destroy()
+    dart_log.close()
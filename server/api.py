@@ -1,12 +1,18 @@
-from typing import Callable, List, Optional
+import json
+from typing import Any, Callable, Dict, Iterator
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 
-from server.classes import Dart
+from server.event_log import EventLog
+from server.tracing import tracer
 
 app = Flask(__name__)
 
-get_darts: Callable[[], List[Dart]]
+dart_events: EventLog
+get_metrics: Callable[[], Dict[str, Any]]
+
+# longest a long poll is held open, and the keep-alive interval of the event stream
+max_wait = 30.0
 
 
 @app.get('/calibrate')
@@ -16,5 +22,61 @@ def calibrate():
 
 @app.get('/darts')
 def read_darts():
-    darts: List[Optional[Dart]] = get_darts()
-    return jsonify([dart.asjson() if dart else None for dart in darts])
+    # ?since=<id> returns the events after that id, &wait=<seconds> holds the request until there is one
+    # a cursor from before a server restart falls back to the current end
+    since = clamp_cursor(request.args.get('since', 0, type=int))
+    wait = min(request.args.get('wait', 0, type=float), max_wait)
+    with tracer.span('api.read_darts', since=since):
+        events = dart_events.wait(since, wait) if wait > 0 else dart_events.since(since)
+        # cursor for the next request
+        last_id = events[-1]['id'] if events else since
+        return jsonify({'events': events, 'last_id': last_id})
+
+
+@app.get('/darts/stream')
+def stream_darts():
+    # server sent events, a reconnecting client resumes after the last event it received
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', 0, type=int)
+    # an EventSource keeps its Last-Event-ID across a server restart
+    since = clamp_cursor(since)
+
+    def generate(event_id: int) -> Iterator[str]:
+        while True:
+            events = dart_events.wait(event_id, max_wait)
+            if not events:
+                yield ': keep-alive\n\n'
+            for event in events:
+                event_id = event['id']
+                yield f'id: {event_id}\nevent: dart\ndata: {json.dumps(event)}\n\n'
+
+    return Response(generate(since), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+def clamp_cursor(event_id: int) -> int:
+    return min(max(event_id, 0), dart_events.last_id)
+
+
+@app.get('/metrics')
+def read_metrics():
+    return jsonify(get_metrics())
+
+
+@app.post('/trace/start')
+def start_trace():
+    tracer.clear()
+    tracer.enable()
+    return {'tracing': True}
+
+
+@app.post('/trace/stop')
+def stop_trace():
+    tracer.disable()
+    return {'tracing': False}
+
+
+@app.get('/trace')
+def read_trace():
+    # chrome trace event json, open in ui.perfetto.dev or chrome://tracing
+    return app.response_class(tracer.to_json(), mimetype='application/json')
@@ -0,0 +1,40 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from server.classes import Image
+
+
+class BackgroundModel:
+    background: np.ndarray
+    # regions where darts landed are taken over at once and no longer blend in
+    frozen: Image
+    learning_rate: float
+    threshold: int
+
+    def __init__(self, image: Image, learning_rate: float = 0.05, threshold: int = 30):
+        self.learning_rate = learning_rate
+        self.threshold = threshold
+        self.reset(image)
+
+    def reset(self, image: Image) -> None:
+        self.background = image.astype(np.float32)
+        self.frozen = np.zeros(image.shape[:2], np.uint8)
+
+    def update(self, image: Image, mask: Optional[Image] = None) -> None:
+        # running average follows lighting drift everywhere outside of frozen regions
+        update_mask = cv2.bitwise_not(self.frozen)
+        if mask is not None:
+            update_mask = cv2.bitwise_and(update_mask, mask)
+        cv2.accumulateWeighted(image, self.background, self.learning_rate, mask=update_mask)
+
+    def foreground(self, image: Image) -> Image:
+        diff_image = cv2.absdiff(image, cv2.convertScaleAbs(self.background))
+        _, foreground_mask = cv2.threshold(diff_image, self.threshold, 255, cv2.THRESH_BINARY)
+        return foreground_mask
+
+    def freeze(self, image: Image, mask: Image) -> None:
+        # a landed dart becomes part of the background, so later darts are diffed without it
+        np.copyto(self.background, image, where=mask.astype(bool))
+        self.frozen = cv2.bitwise_or(self.frozen, mask)
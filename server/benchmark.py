@@ -0,0 +1,181 @@
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Dict, Optional, Tuple, Type, Union
+
+import cv2
+import numpy as np
+
+import server.darts_recognition as recognition
+from server.classes import Frame, Image, Line, Point, Vec2, VectorLine
+from server.math_functions import dist
+
+
+def point_line_frame_intersection(line: VectorLine, frame: Frame) -> Line:
+    # Point based variant the recognition used before Vec2, kept as the benchmark baseline
+
+    def seg_intersect(line1: VectorLine, line2: VectorLine) -> Point:
+        diff = line1.support_vector - line2.support_vector
+        line1_directional_vector_inv = line1.directional_vector.perp()
+        denom = np.dot(line1_directional_vector_inv, line2.directional_vector)
+        num = np.dot(line1_directional_vector_inv, diff)
+        return (num / denom.astype(float)) * line2.directional_vector + line2.support_vector
+
+    rect_lines = [
+        VectorLine(Point(0, 0), Point(1, 0)),
+        VectorLine(Point(0, frame.height - 1), Point(1, 0)),
+        VectorLine(Point(0, 0), Point(0, 1)),
+        VectorLine(Point(frame.width - 1, 0), Point(0, 1))
+    ]
+
+    points = []
+    for rect_line in rect_lines:
+        point = Point.cast(seg_intersect(rect_line, line).astype(int))
+        if rect_line.directional_vector.x and 0 <= point.x < frame.width \
+                or rect_line.directional_vector.y and 0 <= point.y < frame.height:
+            points.append(point)
+
+    return Line(*points[:2])
+
+
+def filter_chain(corners: np.ndarray, frame: Frame, point_type: Type[Union[Point, Vec2]],
+                 line_frame_intersection: Callable[[VectorLine, Frame], Line]) -> Point:
+    # the corner filters of locate_tip_with_corners written per corner, as before vectorizing,
+    # so both point types do exactly the same work
+    mean_x = np.mean(corners, axis=0)[0]
+    close_corners = corners[[mean_x - 150 < point_type.cast(corner).x < mean_x + 150 for corner in corners]]
+
+    vx, vy, x0, y0 = cv2.fitLine(close_corners, cv2.DIST_WELSCH, 0, 0.1, 0.1).ravel().tolist()
+    line = line_frame_intersection(VectorLine(point_type(x0, y0), point_type(vx, vy)), frame)
+    corners_on_line = close_corners[[dist(line, point_type.cast(corner)) <= 20 for corner in close_corners]]
+
+    return recognition.get_real_location(recognition.filter_corners_with_neighbours(corners_on_line))
+
+
+def point_filter(corners: np.ndarray, frame: Frame) -> Point:
+    return filter_chain(corners, frame, Point, point_line_frame_intersection)
+
+
+def vec2_filter(corners: np.ndarray, frame: Frame) -> Point:
+    return filter_chain(corners, frame, Vec2, recognition.line_frame_intersection)
+
+
+def array_filter(corners: np.ndarray, frame: Frame) -> Point:
+    # the vectorized chain the recognition runs now, (N, 2) arrays without a point object per corner
+    close_corners = recognition.filter_close_corners(corners)
+    corners_on_line = recognition.filter_corners_on_line(close_corners, frame)
+    return recognition.get_real_location(recognition.filter_corners_with_neighbours(corners_on_line))
+
+
+def measure(func: Callable, corners: np.ndarray, frame: Frame, repetitions: int) -> Dict[str, float]:
+    start = perf_counter()
+    for _ in range(repetitions):
+        func(corners, frame)
+    duration = perf_counter() - start
+
+    tracemalloc.start()
+    func(corners, frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'us_per_dart': duration / repetitions * 1e6, 'peak_bytes_per_dart': peak}
+
+
+def benchmark_point_representation(num_corners: int = 800, repetitions: int = 200) -> Dict[str, Dict[str, float]]:
+    frame = Frame(1920, 1080)
+
+    # corners scattered around a slanted dart shaft
+    rng = np.random.default_rng(0)
+    t = rng.uniform(0, 1, num_corners)
+    corners = np.column_stack((900 + 60 * t, 300 + 400 * t)) + rng.normal(0, 3, (num_corners, 2))
+    corners = corners.astype(np.float32)
+
+    filters = {'point': point_filter, 'vec2': vec2_filter, 'arrays': array_filter}
+    # all variants must find the same tip, otherwise the timings compare different work
+    tips = {name: tuple(func(corners, frame).tolist()) for name, func in filters.items()}
+    if len(set(tips.values())) != 1:
+        raise ValueError(f'Filter variants disagree: {tips}')
+
+    results = {name: measure(func, corners, frame, repetitions) for name, func in filters.items()}
+    # the per corner objects are short lived, so their size shows where the peak does not
+    results['point']['bytes_per_point'] = sys.getsizeof(Point.cast(corners[0]))
+    results['vec2']['bytes_per_point'] = sys.getsizeof(Vec2.cast(corners[0]))
+    return results
+
+
+def draw_dart(image: Image, tip: Tuple[int, int], angle: float, texture: Image) -> Image:
+    # shaft with a wider flight at the far end, textured so the diff looks like a real dart
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    normal = np.array([-direction[1], direction[0]])
+    tip = np.array(tip, float)
+    flight_start, flight_end = tip + 140 * direction, tip + 195 * direction
+
+    mask = np.zeros(image.shape[:2], np.uint8)
+    cv2.line(mask, tuple(tip.astype(int)), tuple(flight_start.astype(int)), 255, 4)
+    flight = np.array([flight_start, flight_end + 20 * normal, flight_end - 20 * normal]).astype(np.int32)
+    cv2.fillPoly(mask, [flight], 255)
+
+    image = image.copy()
+    image[mask > 0] = texture[mask > 0]
+    return image
+
+
+def corner_tip(diff_image: Image, mask: Image, frame: Frame) -> Optional[Point]:
+    # the corner chain of DetectionPipeline.locate_tip_with_corners without the debug output
+    corners = recognition.get_corners(diff_image, mask)
+    if len(corners) < 20:
+        return None
+    close_corners = recognition.filter_close_corners(corners)
+    if len(close_corners) < 2:
+        return None
+    corners_on_line = recognition.filter_corners_on_line(close_corners, frame)
+    if len(corners_on_line) < 15:
+        return None
+    return recognition.get_real_location(recognition.filter_corners_with_neighbours(corners_on_line))
+
+
+def contour_tip(diff_image: Image, mask: Image, frame: Frame) -> Optional[Point]:
+    tip = recognition.locate_tip_with_contour(diff_image, mask)
+    return None if tip is None else tip[0]
+
+
+def benchmark_tip_locators(num_darts: int = 50, width: int = 1280, height: int = 720) -> Dict[str, Dict[str, float]]:
+    frame = Frame(width, height)
+
+    rng = np.random.default_rng(0)
+    board = cv2.GaussianBlur(rng.integers(60, 120, (height, width), dtype=np.uint8), (7, 7), 0)
+    mask = np.full((height, width), 255, np.uint8)
+
+    tips, times, locations = [], {'corners': [], 'contour': []}, {'corners': [], 'contour': []}
+    for _ in range(num_darts):
+        tip = (int(rng.integers(300, width - 300)), int(rng.integers(200, height - 200)))
+        texture = cv2.resize(rng.choice(np.array([40, 250], np.uint8), (height // 4, width // 4)), (width, height),
+                             interpolation=cv2.INTER_NEAREST)
+        next_image = draw_dart(board, tip, rng.uniform(np.pi / 3, 2 * np.pi / 3), texture)
+        diff_image = recognition.get_blurred_diff(board, next_image)
+        tips.append(tip)
+
+        for name, locate in (('corners', corner_tip), ('contour', contour_tip)):
+            start = perf_counter()
+            location = locate(diff_image, mask, frame)
+            times[name].append(perf_counter() - start)
+            locations[name].append((np.nan, np.nan) if location is None else location)
+
+    tips = np.array(tips, float)
+    results = {}
+    for name in times:
+        errors = np.hypot(*(np.array(locations[name], float) - tips).T)
+        results[name] = {'ms_per_dart': np.mean(times[name]) * 1e3, 'median_error_px': np.nanmedian(errors),
+                         'detected': np.mean(~np.isnan(errors))}
+    # agreement between the two locators on the same diff
+    agreement = np.hypot(*(np.array(locations['corners'], float) - np.array(locations['contour'], float)).T)
+    results['agreement'] = {'median_px': np.nanmedian(agreement), 'within_5px': np.mean(agreement <= 5)}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in benchmark_point_representation().items():
+        print(f'{name:>6}: ' + ', '.join(f'{key} {value:.1f}' for key, value in result.items()))
+
+    for name, result in benchmark_tip_locators().items():
+        print(f'{name:>9}: ' + ', '.join(f'{key} {value:.2f}' for key, value in result.items()))
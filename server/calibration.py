@@ -1,18 +1,21 @@
+import copy
 import os
 import pickle
 from time import sleep
-from typing import Optional
+from typing import List, Optional
 
 import cv2
-import math
 import numpy as np
 
-from server.classes import CalibrationData, Image, Point
+from server.classes import BoardRoi, CalibrationData, Image, Point
 from server.draw import draw_board
 from server.video_capture import VideoStream
 
 original_image: Image
 
+# margin around the outer double ring that still belongs to the board region
+board_roi_margin = 0.1
+
 
 def calibrate(cam: VideoStream) -> Optional[CalibrationData]:
     try:
@@ -120,33 +123,59 @@ def manipulate_transformation_points(image: Image, calibration_data: Calibration
 
 
 def transformation(image: Image, calibration_data: CalibrationData, p1: Point, p2: Point, p3: Point, p4: Point) -> (np.array, Image):
-    points = calibration_data.points
-    new_points = list(map(lambda p: destination_point(p, calibration_data),  calibration_data.dst_points))
-
-    # create transformation matrix
-    src = np.array(list(map(sum, zip(points, [p1, p2, p3, p4]))), np.float32)
-    # src = np.array([
-    #     (points[0].x + p1.x, points[0].y + p1.y),
-    #     (points[1].x + p2.x, points[1].y + p2.y),
-    #     (points[2].x + p3.x, points[2].y + p3.y),
-    #     (points[3].x + p4.x, points[3].y + p4.y)
-    #     map(sum, zip(points, [p1, p2, p3, p4]))
-    # ], np.float32)
-    dst = np.array(new_points, np.float32)
+    # create transformation matrix from (4, 2) arrays instead of a Point per corner
+    src = np.add(calibration_data.points, [p1, p2, p3, p4], dtype=np.float32)
+    dst = destination_points(calibration_data.dst_points, calibration_data).astype(np.float32)
     transformation_matrix = cv2.getPerspectiveTransform(src, dst)
 
     transformed_image = cv2.warpPerspective(image.copy(), transformation_matrix, image.shape[1::-1])
     draw_board(transformed_image, calibration_data)
 
-    for point in new_points:
-        cv2.circle(transformed_image, point.astype(int), 2, (255, 255, 0), 2, 4)
+    for point in dst.astype(int):
+        cv2.circle(transformed_image, point, 2, (255, 255, 0), 2, 4)
 
     return transformation_matrix, transformed_image
 
 
+def get_board_roi(calibration_data: CalibrationData) -> BoardRoi:
+    return calibration_data.cached('board_roi', create_board_roi)
+
+
+def create_board_roi(calibration_data: CalibrationData) -> BoardRoi:
+    width, height = map(int, calibration_data.image_shape)
+    if calibration_data.transformation_matrix.shape != (3, 3):
+        return BoardRoi(0, 0, width, height, np.full((height, width), 255, np.uint8))
+
+    # draw the board in the transformed image and warp it back into the camera image
+    board_mask = np.zeros((height, width), np.uint8)
+    radius = int(calibration_data.ring_radii[5] * (1 + board_roi_margin))
+    cv2.circle(board_mask, calibration_data.center_dartboard.astype(int), radius, 255, thickness=-1)
+    mask = cv2.warpPerspective(board_mask, calibration_data.transformation_matrix, (width, height),
+                               flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP)
+
+    x, y, roi_width, roi_height = cv2.boundingRect(mask)
+    if not roi_width or not roi_height:
+        return BoardRoi(0, 0, width, height, np.full((height, width), 255, np.uint8))
+    return BoardRoi(x, y, roi_width, roi_height, mask[y:y + roi_height, x:x + roi_width].copy())
+
+
+def scale_calibration_data(calibration_data: CalibrationData, level: int) -> CalibrationData:
+    # maps pixels of a pyramid level onto the unchanged full resolution board plane
+    scale = 2 ** level
+    level_to_image = np.array([[scale, 0, (scale - 1) / 2], [0, scale, (scale - 1) / 2], [0, 0, 1]])
+    scaled_calibration_data = copy.copy(calibration_data)
+    scaled_calibration_data.transformation_matrix = calibration_data.transformation_matrix @ level_to_image
+    return scaled_calibration_data
+
+
 def destination_point(i: int, calibration_data: CalibrationData) -> Point:
-    return Point(calibration_data.center_dartboard[0] + calibration_data.ring_radii[5] * math.cos((0.5 + i) * calibration_data.sector_angle),
-                 calibration_data.center_dartboard[1] + calibration_data.ring_radii[5] * math.sin((0.5 + i) * calibration_data.sector_angle))
+    return Point.cast(destination_points([i], calibration_data)[0])
+
+
+def destination_points(indices: List[int], calibration_data: CalibrationData) -> np.ndarray:
+    angles = (0.5 + np.asarray(indices)) * calibration_data.sector_angle
+    return np.column_stack((calibration_data.center_dartboard[0] + calibration_data.ring_radii[5] * np.cos(angles),
+                            calibration_data.center_dartboard[1] + calibration_data.ring_radii[5] * np.sin(angles)))
 
 
 if __name__ == '__main__':
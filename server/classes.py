@@ -3,8 +3,9 @@ from __future__ import annotations
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
+from enum import Enum
 from tkinter import Entry
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import math
 import numpy as np
@@ -44,6 +45,57 @@ class Point(np.ndarray):
         return casted_obj
 
 
+class Vec2:
+    # plain scalar point for hot paths, Point allocates a whole ndarray per instance
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __len__(self) -> int:
+        return 2
+
+    def __getitem__(self, idx):
+        return (self.x, self.y)[idx]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return np.array((self.x, self.y), dtype=dtype)
+
+    def __add__(self, other) -> Vec2:
+        return Vec2(self.x + other[0], self.y + other[1])
+
+    def __sub__(self, other) -> Vec2:
+        return Vec2(self.x - other[0], self.y - other[1])
+
+    def __mul__(self, factor) -> Vec2:
+        return Vec2(self.x * factor, self.y * factor)
+
+    def __eq__(self, other) -> bool:
+        return tuple(self) == tuple(other)
+
+    def __repr__(self) -> str:
+        return f'Vec2(x={self.x}, y={self.y})'
+
+    def dot(self, other) -> float:
+        return self.x * other[0] + self.y * other[1]
+
+    def perp(self) -> Vec2:
+        return Vec2(-self.y, self.x)
+
+    def to_point(self) -> Point:
+        return Point(self.x, self.y)
+
+    @classmethod
+    def cast(cls, obj) -> Vec2:
+        x, y = obj
+        return cls(float(x), float(y))
+
+
 @dataclass(init=False)
 class IntPoint(Point):
     x: int
@@ -77,6 +129,13 @@ class Dart:
         return {k: str(v) for k, v in self.asdict().items()}
 
 
+@dataclass
+class DartDetection:
+    dart: Dart
+    camera_location: Point
+    confidence: float
+
+
 @dataclass
 class Capture:
     darts: List[Dart] = field(default_factory=list)
@@ -140,6 +199,12 @@ class Image(np.ndarray):
     pass
 
 
+@dataclass
+class ImagePyramid:
+    # levels[0] is the full resolution image, every further level halves width and height
+    levels: List[Image]
+
+
 @dataclass(init=False)
 class Circle(Point):
     r: float
@@ -157,6 +222,31 @@ class Ellipse(Point):
     angle: float
 
 
+@dataclass
+class BoardRoi:
+    x: int
+    y: int
+    width: int
+    height: int
+    mask: Image
+
+    @property
+    def offset(self) -> Point:
+        return Point(self.x, self.y)
+
+    @property
+    def frame(self) -> Frame:
+        return Frame(self.width, self.height)
+
+
+@dataclass
+class ScoreLookupTable:
+    # per camera pixel: base, multiplier and location in the transformed board image
+    bases: np.ndarray
+    multipliers: np.ndarray
+    locations: np.ndarray
+
+
 @dataclass
 class Line:
     # rho: InitVar[float]
@@ -186,6 +276,56 @@ class VectorLine:
     directional_vector: Point
 
 
+@dataclass
+class CapturedFrame:
+    seq: int
+    timestamp: float
+    image: Image
+
+
+@dataclass
+class FrameSet:
+    frames: List[CapturedFrame]
+
+    @property
+    def seqs(self) -> List[int]:
+        return [frame.seq for frame in self.frames]
+
+    @property
+    def timestamp(self) -> float:
+        return max(frame.timestamp for frame in self.frames)
+
+    @property
+    def skew(self) -> float:
+        timestamps = [frame.timestamp for frame in self.frames]
+        return max(timestamps) - min(timestamps)
+
+
+class DetectionState(Enum):
+    IDLE = 'idle'
+    MOTION = 'motion'
+    SETTLING = 'settling'
+    DART_CONFIRMED = 'dart_confirmed'
+    PLAYER_IN_ZONE = 'player_in_zone'
+    BOARD_CLEARED = 'board_cleared'
+
+
+class TipLocator(Enum):
+    # Harris corners fitted to a line, top-most supported corner is the tip
+    CORNERS = 'corners'
+    # principal axis of the largest changed blob, thin end is the tip
+    CONTOUR = 'contour'
+
+
+class OverflowPolicy(Enum):
+    # a full subscriber queue loses its oldest pending item
+    DROP_OLDEST = 'drop_oldest'
+    # the publisher waits until the subscriber caught up
+    BLOCK = 'block'
+    # a full subscriber queue collapses to the newest item
+    COALESCE = 'coalesce'
+
+
 @dataclass
 class CancellationToken:
     is_cancelled: bool = False
@@ -220,3 +360,16 @@ class CalibrationData:
         self.dst_points = [12, 2, 17, 7]
         self.offsets = [Point(0.0, 0.0)] * 4
         self.transformation_matrix = np.empty(shape=())
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop('_cache', None)
+        return state
+
+    def cached(self, name: str, factory: Callable[[CalibrationData], Any]) -> Any:
+        # derived data lives next to the calibration and is rebuilt whenever the calibration changes
+        cache = self.__dict__.setdefault('_cache', {})
+        key = (np.asarray(self.transformation_matrix).tobytes(), tuple(self.ring_radii), tuple(self.image_shape))
+        if name not in cache or cache[name][0] != key:
+            cache[name] = (key, factory(self))
+        return cache[name][1]
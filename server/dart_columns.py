@@ -0,0 +1,155 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+# column name -> dtype of the cache file, one value per dart
+column_types: Dict[str, np.dtype] = {
+    'date': np.dtype('datetime64[us]'),
+    'game': np.dtype(np.int32),
+    'player': np.dtype(np.int32),
+    'base': np.dtype(np.int16),
+    'multiplier': np.dtype(np.int8),
+    'loc_x': np.dtype(np.float32),
+    'loc_y': np.dtype(np.float32),
+    # 1 correct, 0 wrong, -1 not reviewed
+    'correctly_detected': np.dtype(np.int8),
+}
+
+
+@dataclass
+class DartColumns:
+    date: np.ndarray
+    game: np.ndarray
+    player: np.ndarray
+    base: np.ndarray
+    multiplier: np.ndarray
+    loc_x: np.ndarray
+    loc_y: np.ndarray
+    correctly_detected: np.ndarray
+    # game and player hold indices into these
+    games: List[str]
+    players: List[str]
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    def select(self, rows: Union[np.ndarray, slice]) -> 'DartColumns':
+        return DartColumns(**{name: getattr(self, name)[rows] for name in column_types},
+                           games=self.games, players=self.players)
+
+    @property
+    def score(self) -> np.ndarray:
+        return self.base.astype(np.int32) * self.multiplier
+
+    @property
+    def day(self) -> np.ndarray:
+        return self.date.astype('datetime64[D]')
+
+
+def load_columns(path: str, cache_dir: Optional[str] = None) -> DartColumns:
+    # the csv is parsed once into one binary file per column, later loads only parse the rows appended since
+    cache_dir = cache_dir or f'{path}.cache'
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with open(path, 'rb') as csv_file:
+        header_line = csv_file.readline()
+        # a rotated log has the same header and may be longer than the old one, its first row tells them apart
+        first_row = csv_file.readline()
+        identity = hashlib.sha1(first_row).hexdigest() if first_row.endswith(b'\n') else ''
+        meta = read_meta(meta_path)
+        if meta is None or meta['header'] != header_line.decode() or meta.get('identity') != identity or \
+                meta['offset'] > os.path.getsize(path):
+            # new, rotated or rewritten log
+            meta = {'header': header_line.decode(), 'identity': identity, 'offset': len(header_line), 'rows': 0,
+                    'games': [], 'players': []}
+        csv_file.seek(meta['offset'])
+        appended = csv_file.read()
+
+    # a row the writer has not finished yet is picked up next time
+    appended = appended[:appended.rfind(b'\n') + 1]
+    header = next(csv.reader([meta['header']]))
+    rows = [row for row in csv.reader(io.StringIO(appended.decode(), newline='')) if row]
+    complete = [row for row in rows if len(row) == len(header)]
+    if len(complete) < len(rows):
+        print(f'Skipped {len(rows) - len(complete)} rows of {path} without {len(header)} columns')
+        rows = complete
+    if rows:
+        new_columns = parse_rows(header, rows, meta['games'], meta['players'])
+        for name, values in new_columns.items():
+            column_path = os.path.join(cache_dir, f'{name}.bin')
+            with open(column_path, 'ab') as column_file:
+                # drops whatever an interrupted update appended after the last consistent state
+                column_file.truncate(meta['rows'] * column_types[name].itemsize)
+                values.tofile(column_file)
+        meta['rows'] += len(rows)
+    if appended:
+        meta['offset'] += len(appended)
+        write_meta(meta_path, meta)
+
+    columns = {name: map_column(os.path.join(cache_dir, f'{name}.bin'), dtype, meta['rows'])
+               for name, dtype in column_types.items()}
+    return DartColumns(**columns, games=meta['games'], players=meta['players'])
+
+
+def parse_rows(header: List[str], rows: List[List[str]], games: List[str], players: List[str]) -> Dict[str, np.ndarray]:
+    # old server logs lack the game, player and review columns
+    if any(len(row) != len(header) for row in rows):
+        raise ValueError(f'Every row needs the {len(header)} columns of the header')
+    values = dict(zip(header, map(np.array, zip(*rows))))
+    missing = np.full(len(rows), '')
+
+    def numbers(name: str) -> np.ndarray:
+        column = values.get(name, missing)
+        return np.where(column == '', 'nan', column).astype(np.float64)
+
+    correct = values.get('correctly_detected', missing)
+    return {
+        'date': values['date'].astype(column_types['date']),
+        'game': encode(values.get('game_id', missing), games),
+        'player': encode(values.get('player_name', missing), players),
+        'base': numbers('base').astype(column_types['base']),
+        'multiplier': numbers('multiplier').astype(column_types['multiplier']),
+        'loc_x': numbers('loc_x').astype(column_types['loc_x']),
+        'loc_y': numbers('loc_y').astype(column_types['loc_y']),
+        'correctly_detected': np.select([correct == 'True', correct == 'False'], [1, 0], -1).astype(
+            column_types['correctly_detected']),
+    }
+
+
+def encode(values: np.ndarray, vocabulary: List[str]) -> np.ndarray:
+    # strings become indices into the vocabulary, which grows with unseen values
+    unique, inverse = np.unique(values, return_inverse=True)
+    index = {value: i for i, value in enumerate(vocabulary)}
+    for value in unique.tolist():
+        if value not in index:
+            index[value] = len(vocabulary)
+            vocabulary.append(value)
+    codes = np.array([index[value] for value in unique.tolist()], dtype=column_types['game'])
+    return codes[inverse.reshape(-1)]
+
+
+def map_column(path: str, dtype: np.dtype, rows: int) -> np.ndarray:
+    if not rows:
+        return np.empty(0, dtype)
+    return np.memmap(path, dtype, mode='r', shape=(rows,))
+
+
+def read_meta(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    with open(path) as meta_file:
+        return json.load(meta_file)
+
+
+def write_meta(path: str, meta: Dict[str, Any]) -> None:
+    # the columns are complete before the meta file points past them
+    with open(f'{path}.tmp', 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(f'{path}.tmp', path)
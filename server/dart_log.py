@@ -0,0 +1,112 @@
+import csv
+import os
+from datetime import date, datetime
+from threading import Lock, Timer
+from typing import Any, Dict, IO, List, Optional
+
+from server.classes import Dart
+
+# one schema for the server and the client log, columns a writer does not know stay empty
+dart_log_fields: List[str] = ['id', 'date', 'game_id', 'player_name', 'base', 'multiplier', 'loc_x', 'loc_y',
+                              'correctly_detected']
+
+
+def dart_row(dart: Dart, **columns: Any) -> Dict[str, Any]:
+    row = dart.asdict()
+    row['correctly_detected'] = str(dart.correctly_detected)
+    row.update(columns)
+    return row
+
+
+class DartLogWriter:
+    path: str
+    # rows are written once this many are buffered or the oldest waited flush_interval seconds
+    batch_size: int
+    flush_interval: float
+    # the file is rotated once it grows beyond max_bytes or a new day starts, 0 / False turn that off
+    # off by default: the analytics only read the current file, rotated history would drop out of them
+    max_bytes: int
+    rotate_daily: bool
+    _buffer: List[Dict[str, Any]]
+    _file: Optional[IO[str]] = None
+    _writer: Optional[csv.DictWriter] = None
+    _opened_on: Optional[date] = None
+    _timer: Optional[Timer] = None
+    _lock: Lock
+
+    def __init__(self, path: str, batch_size: int = 32, flush_interval: float = 5.0, max_bytes: int = 0,
+                 rotate_daily: bool = False):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self._buffer = []
+        self._lock = Lock()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.write_rows([row])
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+            elif self._buffer and self._timer is None:
+                self._timer = Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+
+        if self._file is not None and self._needs_rotation():
+            self._file.close()
+            self._file = None
+            self._rotate()
+        if self._file is None:
+            self._open()
+
+        self._writer.writerows(self._buffer)
+        self._file.flush()
+        self._buffer = []
+
+    def _needs_rotation(self) -> bool:
+        return (self.max_bytes and self._file.tell() >= self.max_bytes) or \
+            (self.rotate_daily and self._opened_on != date.today())
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if os.path.isfile(self.path):
+            with open(self.path, newline='') as csv_file:
+                header = next(csv.reader(csv_file), None)
+            if header != dart_log_fields:
+                # written with another schema, appending would shift the columns
+                self._rotate()
+
+        header_needed = not os.path.isfile(self.path) or not os.path.getsize(self.path)
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.DictWriter(self._file, dart_log_fields, restval='')
+        if header_needed:
+            self._writer.writeheader()
+        self._opened_on = date.today()
+
+    def _rotate(self) -> None:
+        if os.path.isfile(self.path):
+            stem, extension = os.path.splitext(self.path)
+            os.replace(self.path, f'{stem}.{datetime.now():%Y%m%d-%H%M%S-%f}{extension}')
@@ -0,0 +1,154 @@
+import csv
+import sqlite3
+import sys
+from datetime import datetime, time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from server.dart_log import DartLogWriter
+
+schema = '''
+CREATE TABLE IF NOT EXISTS darts (
+    id TEXT PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    game_id TEXT,
+    player TEXT,
+    base INTEGER NOT NULL,
+    multiplier INTEGER NOT NULL,
+    loc_x REAL,
+    loc_y REAL,
+    correctly_detected INTEGER,
+    board_id TEXT
+);
+CREATE INDEX IF NOT EXISTS darts_timestamp ON darts (timestamp);
+CREATE INDEX IF NOT EXISTS darts_game ON darts (game_id, timestamp);
+CREATE INDEX IF NOT EXISTS darts_player ON darts (player, timestamp);
+'''
+
+store_fields: List[str] = ['id', 'timestamp', 'game_id', 'player', 'base', 'multiplier', 'loc_x', 'loc_y',
+                           'correctly_detected', 'board_id']
+
+
+class DartStore:
+    # same write interface as DartLogWriter, so either one can back log_dart
+    path: str
+    board_id: Optional[str]
+    _connection: Optional[sqlite3.Connection] = None
+    _lock: Lock
+
+    def __init__(self, path: str, board_id: Optional[str] = None):
+        self.path = path
+        self.board_id = board_id
+        self._lock = Lock()
+        with self._lock:
+            self._connect()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.write_rows([row])
+
+    def write_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        values = [store_values(row, self.board_id) for row in rows]
+        with self._lock, self._connect() as connection:
+            # ids are uuids, importing a log twice keeps the darts already stored
+            cursor = connection.executemany(
+                f'INSERT OR IGNORE INTO darts ({", ".join(store_fields)}) VALUES ({", ".join("?" * len(store_fields))})',
+                values)
+            return cursor.rowcount
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        # like DartLogWriter the store can be written again after close, it reconnects on demand
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def import_csv(self, path: str) -> int:
+        with open(path, newline='') as csv_file:
+            return self.write_rows(csv.DictReader(csv_file))
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None, game_id: Optional[str] = None,
+              player: Optional[str] = None) -> List[Dict[str, Any]]:
+        conditions: List[str] = []
+        parameters: List[Any] = []
+        if game_id is not None:
+            conditions.append('game_id = ?'); parameters.append(game_id)
+        if player is not None:
+            conditions.append('player = ?'); parameters.append(player)
+        if start is not None:
+            conditions.append('timestamp >= ?'); parameters.append(start.timestamp())
+        if end is not None:
+            conditions.append('timestamp < ?'); parameters.append(end.timestamp())
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._lock:
+            rows = self._connect().execute(f'SELECT * FROM darts {where} ORDER BY timestamp', parameters).fetchall()
+        return [dict(row) for row in rows]
+
+    def today(self, player: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.query(start=datetime.combine(datetime.today(), time()), player=player)
+
+    def last_game_id(self) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT game_id FROM darts WHERE game_id IS NOT NULL ORDER BY timestamp DESC LIMIT 1').fetchone()
+        return row['game_id'] if row else None
+
+    def last_game(self) -> List[Dict[str, Any]]:
+        game_id = self.last_game_id()
+        return self.query(game_id=game_id) if game_id is not None else []
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # written from the dispatcher's thread, read from the api's
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            # a commit per dart stays cheap without a full sync
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(schema)
+        return self._connection
+
+
+def store_values(row: Dict[str, Any], board_id: Optional[str] = None) -> Tuple[Any, ...]:
+    # rows come from dart_row with native values or from old csv logs with strings only
+    def text(value: Any) -> Optional[str]:
+        return str(value) if value not in (None, '') else None
+
+    def number(value: Any) -> Optional[float]:
+        return float(value) if value not in (None, '') else None
+
+    date = row['date']
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    correct = row.get('correctly_detected')
+    if isinstance(correct, str):
+        correct = {'True': True, 'False': False}.get(correct)
+
+    return (
+        str(row['id']),
+        date.timestamp(),
+        text(row.get('game_id')),
+        text(row.get('player_name')),
+        int(float(row['base'])),
+        int(float(row['multiplier'])),
+        number(row.get('loc_x')),
+        number(row.get('loc_y')),
+        None if correct is None else int(correct),
+        text(row.get('board_id')) or board_id,
+    )
+
+
+def open_dart_log(path: str) -> Union[DartLogWriter, DartStore]:
+    if path.endswith(('.db', '.sqlite')):
+        return DartStore(path)
+    return DartLogWriter(path)
+
+
+if __name__ == '__main__':
+    # one shot import of the csv logs: python -m server.dart_store tmp/darts.db tmp/darts_log.csv ...
+    store = DartStore(sys.argv[1])
+    for csv_path in sys.argv[2:]:
+        print(f'{csv_path}: {store.import_csv(csv_path)} darts imported')
+    store.close()
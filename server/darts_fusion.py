@@ -0,0 +1,48 @@
+from copy import copy
+from typing import List, Optional
+
+import numpy as np
+
+from server.classes import CalibrationData, Dart, DartDetection, Point
+from server.darts_mapping import get_dart_region
+
+# max distance between two cameras' locations, relative to the outer double ring radius (~8.5 mm)
+max_disagreement = 0.05
+
+
+def to_reference_plane(location: Point, calibration_data: CalibrationData, reference: CalibrationData) -> Point:
+    # board planes of different cameras only differ by center and scale
+    scale = reference.ring_radii[5] / calibration_data.ring_radii[5]
+    return Point.cast(reference.center_dartboard + (location - calibration_data.center_dartboard) * scale)
+
+
+def fuse_detections(detections: List[Optional[DartDetection]], calibrations: List[CalibrationData]) -> Optional[Dart]:
+    reference = calibrations[0]
+    located = [(detection, calibration_data) for detection, calibration_data in zip(detections, calibrations) if detection]
+    if not located:
+        return None
+
+    locations = np.array([to_reference_plane(detection.dart.location, calibration_data, reference)
+                          for detection, calibration_data in located], dtype=float)
+    confidences = np.array([detection.confidence for detection, _ in located], dtype=float)
+
+    spread = np.max(np.linalg.norm(locations[:, None] - locations[None, :], axis=-1))
+    if len(located) == 1 or spread > max_disagreement * reference.ring_radii[5] or not confidences.sum():
+        if len(located) > 1:
+            # cameras disagree - trust the most confident one
+            print('Cameras disagree', spread)
+        # one camera decides, its dart was already scored by the pipeline
+        return on_reference_plane(*located[np.argmax(confidences)], reference)
+
+    fused_location = Point.cast(np.average(locations, axis=0, weights=confidences))
+    dart = get_dart_region(fused_location, reference)
+    dart.location = fused_location
+    return dart
+
+
+def on_reference_plane(detection: DartDetection, calibration_data: CalibrationData, reference: CalibrationData) -> Dart:
+    # the score and the angle do not depend on the board plane, the magnitude and location follow its scale
+    dart = copy(detection.dart)
+    dart.magnitude *= float(reference.ring_radii[5] / calibration_data.ring_radii[5])
+    dart.location = to_reference_plane(detection.dart.location, calibration_data, reference)
+    return dart
@@ -1,59 +1,117 @@
+from typing import Tuple
+
 import cv2
 import math
 import numpy as np
+import numpy.typing as npt
+
+from server.classes import CalibrationData, Dart, Point, ScoreLookupTable
 
-from server.classes import CalibrationData, Dart, Point
+dart_base = [20, 5, 12, 9, 14, 11, 8, 16, 7, 19, 3, 17, 2, 15, 10, 6, 13, 4, 18, 1]
+
+# reference angle for atan2 conversion
+ref_angle = 81
 
 
 def get_transformed_location(location: Point, calibration_data: CalibrationData) -> Point:
     # transform only the hit point with the saved transformation matrix
-    dart_loc = cv2.perspectiveTransform(np.array([[location]]), calibration_data.transformation_matrix)
-    transformed_dart_loc = dart_loc.reshape(1, -1)[0]
-    return Point.cast(transformed_dart_loc)
+    return Point.cast(get_transformed_locations(np.array([location]), calibration_data)[0])
+
+
+def get_transformed_locations(locations: npt.ArrayLike, calibration_data: CalibrationData) -> np.ndarray:
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+    if not len(locations):
+        return locations
+    transformed_locations = cv2.perspectiveTransform(locations[None], calibration_data.transformation_matrix)
+    return transformed_locations.reshape(-1, 2)
 
 
 # Returns dartThrow (score, multiplier, angle, magnitude) based on x,y location
 def get_dart_region(dart_loc: Point, calibration_data: CalibrationData) -> Dart:
+    bases, multipliers, magnitudes, angles = get_dart_regions(np.array([dart_loc]), calibration_data)
+    if not multipliers[0]:  # miss
+        print('miss', magnitudes[0])
+    return Dart(int(bases[0]), int(multipliers[0]), float(magnitudes[0]), float(angles[0]))
+
+
+# Returns bases, multipliers, magnitudes and angles for an array of x,y locations
+def get_dart_regions(dart_locs: npt.ArrayLike, calibration_data: CalibrationData,
+                     reference_angle: float = ref_angle) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     frame = calibration_data.image_shape
+    dart_locs = np.asarray(dart_locs, dtype=float).reshape(-1, 2)
+
+    # find the magnitude and angle of the darts
+    vx = dart_locs[:, 0] - frame.width / 2
+    vy = frame.height / 2 - dart_locs[:, 1]
+
+    magnitudes = np.sqrt(vx ** 2 + vy ** 2)
+    angles = np.fmod(np.arctan2(vy, vx) * 180 / math.pi + 360 - reference_angle, 360)
+
+    sectors = (angles / 18).astype(int)
+    bases = np.where(sectors < len(dart_base), np.take(dart_base, np.minimum(sectors, len(dart_base) - 1)), -1)
+
+    # find the ring that encloses the dart:
+    # double bull, single bull, single, triple, single, double, miss
+    rings = np.searchsorted(calibration_data.ring_radii, magnitudes, side='left')
+    multipliers = np.take([2, 1, 1, 3, 1, 2, 0], rings)
+    bases = np.select([rings <= 1, rings == len(calibration_data.ring_radii)], [25, 0], bases)
+
+    return bases, multipliers, magnitudes, angles
+
 
-    # find the magnitude and angle of the dart
+# Returns magnitude and angle of a single x,y location, same math as get_dart_regions without the array overhead
+def get_polar(dart_loc: Point, calibration_data: CalibrationData, reference_angle: float = ref_angle) -> Tuple[float, float]:
+    frame = calibration_data.image_shape
     vx = dart_loc[0] - frame.width / 2
     vy = frame.height / 2 - dart_loc[1]
+    return math.hypot(vx, vy), math.fmod(math.atan2(vy, vx) * 180 / math.pi + 360 - reference_angle, 360)
+
+
+def get_score_lookup_table(calibration_data: CalibrationData) -> ScoreLookupTable:
+    return calibration_data.cached('score_lookup_table', create_score_lookup_table)
+
+
+def create_score_lookup_table(calibration_data: CalibrationData) -> ScoreLookupTable:
+    width, height = map(int, calibration_data.image_shape)
+
+    # transform and score every camera pixel at once
+    xs, ys = np.meshgrid(np.arange(width, dtype=float), np.arange(height, dtype=float))
+    locations = get_transformed_locations(np.dstack((xs, ys)), calibration_data)
+    bases, multipliers, _, _ = get_dart_regions(locations, calibration_data)
+
+    return ScoreLookupTable(bases.astype(np.int8).reshape(height, width),
+                            multipliers.astype(np.int8).reshape(height, width),
+                            locations.astype(np.float32).reshape(height, width, 2))
+
+
+def lookup_dart(location: Point, calibration_data: CalibrationData, interpolate: bool = False) -> Dart:
+    lookup_table = get_score_lookup_table(calibration_data)
+
+    if interpolate:
+        # sub-pixel locations: interpolate the board location and score it exactly
+        transformed_location = Point.cast(interpolate_location(lookup_table, location))
+        dart = get_dart_region(transformed_location, calibration_data)
+        dart.location = transformed_location
+        return dart
+
+    # plain python scalars, a numpy call per coordinate costs more than the whole lookup
+    height, width = lookup_table.bases.shape
+    x = min(max(round(float(location[0])), 0), width - 1)
+    y = min(max(round(float(location[1])), 0), height - 1)
+    transformed_location = Point(*map(float, lookup_table.locations[y, x]))
+    magnitude, angle = get_polar(transformed_location, calibration_data)
+
+    dart = Dart(int(lookup_table.bases[y, x]), int(lookup_table.multipliers[y, x]), magnitude, angle)
+    dart.location = transformed_location
+    return dart
+
 
-    # reference angle for atan2 conversion
-    ref_angle = 81
-
-    magnitude = math.sqrt(math.pow(vx, 2) + math.pow(vy, 2))
-    angle = math.fmod(((math.atan2(vy, vx) * 180 / math.pi) + 360 - ref_angle), 360)
-
-    angle_diff_mul = int(angle / 18)
-
-    dart_base = [20, 5, 12, 9, 14, 11, 8, 16, 7, 19, 3, 17, 2, 15, 10, 6, 13, 4, 18, 1]
-    try:
-        base = dart_base[angle_diff_mul]
-    except IndexError:
-        base = -1
-
-    # Calculating multiplier (and special cases for Bull's Eye):
-    for i in range(0, len(calibration_data.ring_radii)):
-        # Find the ring that encloses the dart
-        if magnitude <= calibration_data.ring_radii[i]:
-            if i == 0:  # Double Bull's Eye
-                base = 25
-                multiplier = 2
-            elif i == 1:  # Single Bull's Eye
-                base = 25
-                multiplier = 1
-            elif i == 3:  # Triple
-                multiplier = 3
-            elif i == 5:  # Double
-                multiplier = 2
-            else:  # Single
-                multiplier = 1
-            break
-    else:  # miss
-        print('miss', magnitude)
-        base = 0
-        multiplier = 0
-
-    return Dart(base, multiplier, magnitude, angle)
+def interpolate_location(lookup_table: ScoreLookupTable, location: Point) -> np.ndarray:
+    height, width = lookup_table.bases.shape
+    x, y = np.clip(location, 0, (width - 1, height - 1))
+    x0, y0 = min(int(x), width - 2), min(int(y), height - 2)
+    fx, fy = x - x0, y - y0
+    cell = lookup_table.locations[y0:y0 + 2, x0:x0 + 2].astype(float)
+    top = cell[0, 0] * (1 - fx) + cell[0, 1] * fx
+    bottom = cell[1, 0] * (1 - fx) + cell[1, 1] * fx
+    return top * (1 - fy) + bottom * fy
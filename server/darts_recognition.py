@@ -1,131 +1,485 @@
-import time
-from typing import Optional
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 import numpy.typing as npt
 
-from server.classes import CalibrationData, CancellationToken, Dart, Frame, Image, Line, Point, VectorLine
-from server.darts_mapping import get_dart_region, get_transformed_location
-from server.math_functions import dist
-from server.video_capture import VideoStream
+from server.background_model import BackgroundModel
+from server.calibration import get_board_roi, scale_calibration_data
+from server.classes import BoardRoi, CalibrationData, CancellationToken, CapturedFrame, Dart, DartDetection, DetectionState, Frame, FrameSet, Image, ImagePyramid, Line, Point, TipLocator, Vec2, VectorLine
+from server.darts_fusion import fuse_detections
+from server.debug_writer import DebugWriter
+from server.darts_mapping import get_dart_region, get_score_lookup_table, get_transformed_location, lookup_dart
+from server.math_functions import dists
+from server.metrics import PipelineMetrics
+from server.tracing import tracer
+from server.video_capture import CaptureGroup, VideoStream
+from server.visit_tracker import VisitTracker
 
 DEBUG = True
-dbg_next_image: Image
-dbg_diff_image: Image
+# debug images of the detection being processed, None if it is not sampled
+debug_writer = DebugWriter()
+
+
+class DetectionPipeline:
+    calibration_data: CalibrationData
+    roi: BoardRoi
+    reference: ImagePyramid
+    previous: ImagePyramid
+    # last view of the board without darts, the board counts as cleared once it looks like this again
+    empty_board: ImagePyramid
+    board_empty: bool = True
+    background: BackgroundModel
+    metrics: PipelineMetrics
+    state: DetectionState = DetectionState.IDLE
+    detection: Optional[DartDetection] = None
+    # debug images of the current detection, per pipeline since the cameras are processed in parallel
+    dbg_next_image: Optional[Image] = None
+    dbg_diff_image: Optional[Image] = None
+    motion_started_at: float = 0.0
+    still_frames: int = 0
+    still_since: Optional[float] = None
+    attempts: int = 0
+
+    min_threshold: int = 100
+    max_threshold: int = 100_000
+    max_corners: int = 2000
+    # pyramid level of the cheap motion check that gates the filtered full resolution diff
+    motion_level: int = 2
+    # pyramid level the background model runs on
+    background_level: int = 1
+    # pyramid level the corner search runs on, the tip is refined at full resolution afterwards
+    detection_level: int = 0
+    # half size of the full resolution window around the coarse tip
+    refinement_window: int = 24
+    tip_locator: TipLocator = TipLocator.CORNERS
+    # diff level that counts as changed for the contour locator
+    contour_threshold: int = 30
+    # smallest blob in full resolution pixels the contour locator takes for a dart
+    min_contour_area: int = 150
+    # pieces of the changed area closer than this in full resolution pixels belong to the same dart
+    contour_gap: int = 25
+    # consecutive unchanged frames after which the board counts as settled
+    settle_frames: int = 2
+    # locate the dart anyway if the board keeps moving for longer than this
+    max_settle_time: float = 0.5
+    # how long the board has to be still after the player left the zone if darts were left in the board
+    clear_time: float = 1.0
+
+    def __init__(self, calibration_data: CalibrationData, frame: CapturedFrame, state: DetectionState = DetectionState.IDLE,
+                 detection_level: int = 0, tip_locator: TipLocator = TipLocator.CORNERS):
+        self.calibration_data = calibration_data
+        self.metrics = PipelineMetrics()
+        self.roi = get_board_roi(calibration_data)
+        if calibration_data.transformation_matrix.shape == (3, 3):
+            # build the lookup table now instead of on the first dart
+            get_score_lookup_table(calibration_data)
+        self.detection_level = detection_level
+        self.tip_locator = tip_locator
+        self.reference = self.get_pyramid(frame)
+        self.previous = self.reference
+        self.empty_board = self.reference
+        self.background = BackgroundModel(self.reference.levels[self.background_level])
+        self.state = state
+
+    @property
+    def is_busy(self) -> bool:
+        return self.state in (DetectionState.MOTION, DetectionState.SETTLING)
+
+    def process(self, frame: CapturedFrame) -> DetectionState:
+        with self.metrics.time('process', seq=frame.seq, capture_timestamp=frame.timestamp, state=self.state.value):
+            return self.advance(frame)
+
+    def advance(self, frame: CapturedFrame) -> DetectionState:
+        next_image = self.get_pyramid(frame)
+        previous_image, self.previous = self.previous, next_image
+
+        if self.state in (DetectionState.DART_CONFIRMED, DetectionState.BOARD_CLEARED):
+            self.state = DetectionState.IDLE
+
+        if self.state == DetectionState.IDLE:
+            # check if dart hit the board
+            num_changed_pixels = self.count_changed_pixels(self.reference, next_image)
+
+            # missed dart
+            if num_changed_pixels <= self.min_threshold:
+                if num_changed_pixels > 0:
+                    print(num_changed_pixels)
+                self.reference = next_image
+                with self.metrics.time('background'):
+                    self.background.update(next_image.levels[self.background_level])
+                if self.board_empty:
+                    # follow lighting drift of the empty board
+                    self.empty_board = next_image
+
+            # num of changed pixels indicates dart
+            elif num_changed_pixels < self.max_threshold:
+                self.motion_started_at = frame.timestamp
+                self.still_frames = 0
+                self.state = DetectionState.MOTION
+
+            # if player enters zone - stop detection
+            else:
+                print('Player entered zone')
+                print(num_changed_pixels)
+                self.metrics.reject('player_in_zone')
+                self.enter_zone()
 
+        elif self.state in (DetectionState.MOTION, DetectionState.SETTLING):
+            if self.count_changed_pixels(self.reference, next_image) >= self.max_threshold:
+                print('Player entered zone')
+                self.metrics.reject('player_in_zone')
+                self.enter_zone()
+                return self.state
 
-def get_dart(cam: VideoStream, calibration_data: CalibrationData, token: CancellationToken) -> Optional[Dart]:
-    global dbg_next_image
-    global dbg_diff_image
+            # wait for camera vibrations
+            if self.count_changed_pixels(previous_image, next_image) > self.min_threshold:
+                self.still_frames = 0
+                self.state = DetectionState.MOTION
+            else:
+                self.still_frames += 1
+                self.state = DetectionState.SETTLING
+
+            if self.still_frames >= self.settle_frames or frame.timestamp - self.motion_started_at >= self.max_settle_time:
+                self.attempts += 1
+                with self.metrics.time('background'):
+                    foreground_mask = self.background.foreground(next_image.levels[self.background_level])
+                with self.metrics.time('locate'):
+                    self.detection = self.locate_dart(next_image, foreground_mask)
+                if self.state == DetectionState.PLAYER_IN_ZONE:
+                    return self.state
+                if self.detection:
+                    self.reference = next_image
+                    self.background.freeze(next_image.levels[self.background_level], foreground_mask)
+                    self.board_empty = False
+                    self.state = DetectionState.DART_CONFIRMED
+                elif self.only_darts_changed(foreground_mask):
+                    # a dart already in the board was knocked, take it over without scoring it again
+                    print('Dart in board moved')
+                    self.metrics.reject('dart_in_board_moved')
+                    self.reference = next_image
+                    self.background.freeze(next_image.levels[self.background_level], foreground_mask)
+                    self.board_empty = False
+                    self.state = DetectionState.IDLE
+                else:
+                    self.state = DetectionState.IDLE
+
+        elif self.state == DetectionState.PLAYER_IN_ZONE:
+            # the player left once the board stopped changing
+            if self.count_changed_pixels(previous_image, next_image) > self.min_threshold:
+                self.still_frames = 0
+                self.still_since = None
+            else:
+                self.still_frames += 1
+                if self.still_since is None:
+                    self.still_since = frame.timestamp
+
+            if self.still_frames >= self.settle_frames and self.count_changed_pixels(self.empty_board, next_image) <= self.min_threshold:
+                # darts pulled, the next round can start right away
+                self.retake_reference(next_image)
+            elif self.still_since is not None and frame.timestamp - self.still_since >= self.clear_time:
+                self.leave_zone(next_image)
+
+        return self.state
+
+    def get_pyramid(self, frame: CapturedFrame) -> ImagePyramid:
+        with self.metrics.time('gray'):
+            gray_image = get_gray(frame.image, self.roi)
+        with self.metrics.time('pyramid'):
+            return build_pyramid(gray_image, max(self.motion_level, self.background_level, self.detection_level))
+
+    def count_changed_pixels(self, image: ImagePyramid, next_image: ImagePyramid) -> int:
+        # the filtered full resolution diff only runs if the cheap check on the downsampled images fires
+        with self.metrics.time('motion_estimate'):
+            estimate = estimate_changed_pixels(image, next_image, self.motion_level)
+        if estimate <= self.min_threshold / 2:
+            return estimate
+        with self.metrics.time('binary_diff'):
+            return count_changed_pixels(image.levels[0], next_image.levels[0])
+
+    def only_darts_changed(self, foreground_mask: Image) -> bool:
+        if not cv2.countNonZero(self.background.frozen):
+            return False
+        new_pixels = cv2.countNonZero(cv2.bitwise_and(foreground_mask, cv2.bitwise_not(self.background.frozen)))
+        return new_pixels * 4 ** self.background_level <= self.min_threshold
+
+    def enter_zone(self) -> None:
+        self.still_frames = 0
+        self.still_since = None
+        self.state = DetectionState.PLAYER_IN_ZONE
+
+    def retake_reference(self, next_image: ImagePyramid) -> None:
+        # the board is taken as empty from here on
+        self.reference = next_image
+        self.empty_board = next_image
+        self.board_empty = True
+        self.background.reset(next_image.levels[self.background_level])
+        self.state = DetectionState.BOARD_CLEARED
+
+    def leave_zone(self, next_image: ImagePyramid) -> None:
+        # player left without pulling the darts, they stay part of the background
+        print('Player left zone, darts still in board')
+        level = self.background_level
+        _, darts_mask = cv2.threshold(cv2.absdiff(self.empty_board.levels[level], next_image.levels[level]),
+                                      self.background.threshold, 255, cv2.THRESH_BINARY)
+        self.reference = next_image
+        self.background.reset(next_image.levels[level])
+        self.background.freeze(next_image.levels[level], darts_mask)
+        self.state = DetectionState.IDLE
+
+    def locate_dart(self, next_pyramid: ImagePyramid, foreground_mask: Image) -> Optional[DartDetection]:
+        # coarse to fine: corners are searched on a pyramid level, distances shrink with the level
+        level = self.detection_level
+        scale = 2 ** level
+        next_image = next_pyramid.levels[level]
+        height, width = next_image.shape[:2]
+
+        # only corners on the new dart count, earlier darts and lighting drift are part of the background
+        foreground_mask = cv2.dilate(cv2.resize(foreground_mask, (width, height), interpolation=cv2.INTER_NEAREST), np.ones((5, 5), np.uint8))
+        roi_mask = cv2.resize(self.roi.mask, (width, height), interpolation=cv2.INTER_NEAREST)
+        # a new dart may land in front of an earlier one, so frozen darts stay searchable and only changes count
+        corners_mask = cv2.bitwise_and(roi_mask, foreground_mask)
+
+        # filter noise
+        with self.metrics.time('blurred_diff'):
+            diff_image = get_blurred_diff(self.reference.levels[level], next_image)
+        # debug images are only drawn for sampled detections and written on the writer's thread
+        self.dbg_next_image = cv2.cvtColor(next_image, cv2.COLOR_GRAY2RGB) if DEBUG and debug_writer.sample() else None
+
+        if self.tip_locator == TipLocator.CONTOUR:
+            # averaging a thin shaft down a level also divides its contrast
+            with self.metrics.time('contour'):
+                tip = locate_tip_with_contour(diff_image, corners_mask, self.contour_threshold / scale, self.min_contour_area / scale**2,
+                                              max(self.contour_gap // scale, 1), metrics=self.metrics)
+        else:
+            tip = self.locate_tip_with_corners(diff_image, corners_mask, scale)
+        if tip is None:
+            return None
+        location_of_dart, confidence = tip
+
+        # check if it was really a dart
+        _, binary_diff = cv2.threshold(diff_image, 60, 255, 0)
+        if cv2.countNonZero(binary_diff) * scale ** 2 > self.max_threshold:
+            print('Player entered zone', cv2.countNonZero(binary_diff))
+            self.metrics.reject('player_in_zone')
+            self.enter_zone()
+            return None
+
+        # pixel centers of an area downsampled level sit between the full resolution pixels
+        camera_location = (location_of_dart + 0.5) * scale - 0.5
+        if level and self.refinement_window:
+            with self.metrics.time('refine'):
+                camera_location = refine_location(camera_location, self.reference.levels[0], next_pyramid.levels[0],
+                                                  self.roi.mask, self.refinement_window, self.tip_locator, self.contour_threshold,
+                                                  self.min_threshold)
+
+        with self.metrics.time('score'):
+            if level and not self.refinement_window:
+                level_calibration_data = self.calibration_data.cached(f'level_{level}', lambda c: scale_calibration_data(c, level))
+                transformed_location = get_transformed_location(location_of_dart + self.roi.offset / scale, level_calibration_data)
+                dart_info = get_dart_region(transformed_location, self.calibration_data)
+                dart_info.location = transformed_location
+            else:
+                # tips sit on whole pixels, so scoring is a single table lookup
+                dart_info = lookup_dart(camera_location + self.roi.offset, self.calibration_data)
+
+        print("Dart detected")
+        print(f'{dart_info.multiplier}x{dart_info.base}')
+
+        if self.dbg_next_image is not None:
+            # copy debug images
+            self.dbg_diff_image = diff_image.copy()
+            # draw darts location
+            cv2.circle(self.dbg_next_image, location_of_dart.astype(int), 1, color=(255, 0, 255), thickness=1)
+            cv2.circle(self.dbg_next_image, location_of_dart.astype(int), 20, color=(255, 0, 255), thickness=1)
+            # mark dart on test image
+            cv2.circle(self.dbg_diff_image, location_of_dart.astype(int), 10, color=(255, 255, 255), thickness=1, lineType=8)
+            # write debug images
+            debug_writer.submit({'dart': self.dbg_diff_image, 'corners': self.dbg_next_image})
+
+        return DartDetection(dart_info, Point.cast(camera_location + self.roi.offset), confidence)
+
+    def locate_tip_with_corners(self, diff_image: Image, mask: Image, scale: int) -> Optional[Tuple[Point, float]]:
+        # get corners
+        with self.metrics.time('corners'):
+            corners = get_corners(diff_image, mask)
+
+        # dart detected?
+        if corners.size < 40 / scale or corners.size == self.max_corners * 2:
+            print("Dart not detected (pre-processing)")
+            print('corners:', len(corners))
+            self.metrics.reject('pre_processing')
+            return None
+
+        # filter corners
+        # close_corners_r = filter_corners_of_flight(corners_r)
+        with self.metrics.time('filter_close'):
+            close_corners = filter_close_corners(corners, 150 / scale, self.dbg_next_image)
+        if close_corners.size == 0:
+            print('Dart not detected (in-processing)')
+            self.metrics.reject('in_processing')
+            return None
+        height, width = diff_image.shape[:2]
+        with self.metrics.time('filter_line'):
+            corners_on_line = filter_corners_on_line(close_corners, Frame(width, height), 20 / scale, self.dbg_next_image)
+
+        if self.dbg_next_image is not None:
+            # draw all different corners
+            dbg_draw_corners(self.dbg_next_image, corners, close_corners, corners_on_line)
+
+        # dart detected?
+        if corners_on_line.size < 30 / scale:
+            print("Dart not detected (post-processing)")
+            print('corners:', len(corners_on_line))
+            self.metrics.reject('post_processing')
+            if self.dbg_next_image is not None:
+                # copy debug images
+                self.dbg_diff_image = diff_image.copy()
+                # write debug images
+                debug_writer.submit({'dart': self.dbg_diff_image, 'corners': self.dbg_next_image})
+            return None
 
-    min_threshold = 100
-    max_threshold = 100_000
+        # get final darts location
+        with self.metrics.time('filter_neighbours'):
+            corners_with_neighbours = filter_corners_with_neighbours(corners_on_line, 40 / scale)
 
-    max_corners = 2000
+        # share of the dart's corners that support the fitted line
+        confidence = len(corners_on_line) / len(close_corners)
+        return get_real_location(corners_with_neighbours), confidence
 
-    image = get_gray(cam)
 
+def frames(cam: VideoStream, token: CancellationToken) -> Iterator[CapturedFrame]:
+    frame = cam.read_frame()
     while not token.is_cancelled:
-        time.sleep(0.1)
+        next_frame = cam.wait_for_frame(frame.seq, timeout=1)
+        if next_frame is None:
+            if cam.stopped:
+                break
+            continue
+        frame = next_frame
+        yield frame
 
-        # check if dart hit the board
-        next_image = get_gray(cam)
-        binary_diff = get_binary_diff(image, next_image)
-        num_changed_pixels = cv2.countNonZero(binary_diff)
 
-        # num of changed pixels indicates dart
-        if min_threshold < num_changed_pixels < max_threshold:
-            # wait for camera vibrations
-            time.sleep(0.2)
-
-            # filter noise
-            next_image = get_gray(cam)
-            diff_image = get_blurred_diff(image, next_image)
-            dbg_next_image = cv2.cvtColor(next_image, cv2.COLOR_GRAY2RGB)
-
-            # get corners
-            corners = get_corners(diff_image)
-
-            # dart detected?
-            if corners.size < 40 or corners.size == max_corners * 2:
-                print("Dart not detected (pre-processing)")
-                print('corners:', len(corners))
-                continue
-
-            # filter corners
-            # close_corners_r = filter_corners_of_flight(corners_r)
-            close_corners = filter_close_corners(corners)
-            if close_corners.size == 0:
-                print('Dart not detected (in-processing)')
-                continue
-            corners_on_line = filter_corners_on_line(close_corners, calibration_data.image_shape)
-
-            # dart detected?
-            if corners_on_line.size < 30:
-                print("Dart not detected (post-processing)")
-                print('corners:', len(corners_on_line))
-                if DEBUG:
-                    # copy debug images
-                    dbg_diff_image = diff_image.copy()
-                    # draw all different corners
-                    dbg_draw_corners(corners, close_corners, corners_on_line)
-                    # write debug images
-                    cv2.imwrite(f'tmp/dbg_dart.jpg', dbg_diff_image)
-                    cv2.imwrite(f'tmp/dbg_corners.jpg', dbg_next_image)
-                continue
-
-            # check if it was really a dart
-            _, binary_diff = cv2.threshold(diff_image, 60, 255, 0)
-            if cv2.countNonZero(binary_diff) > max_threshold:
-                print('Player entered zone', cv2.countNonZero(binary_diff))
+def frame_sets(cams: CaptureGroup, token: CancellationToken) -> Iterator[FrameSet]:
+    frame_set = cams.read_set()
+    while not token.is_cancelled:
+        next_frame_set = cams.wait_for_set(frame_set, timeout=1)
+        if next_frame_set is None:
+            if cams.stopped:
                 break
+            continue
+        frame_set = next_frame_set
+        yield frame_set
 
-            # get final darts location
-            corners_with_neighbours = filter_corners_with_neighbours(corners_on_line)
 
-            location_of_dart = get_real_location(corners_with_neighbours)
-            transformed_location = get_transformed_location(location_of_dart, calibration_data)
-            dart_info = get_dart_region(transformed_location, calibration_data)
-            dart_info.location = transformed_location
+def process_frame_set(pipelines: List[DetectionPipeline], frame_set: FrameSet, executor: Optional[Executor]) -> List[DetectionState]:
+    # every camera runs its own pipeline, so a frame set costs as much as the slowest camera
+    if executor is None or len(pipelines) == 1:
+        return [pipeline.process(frame) for pipeline, frame in zip(pipelines, frame_set.frames)]
+    return list(executor.map(DetectionPipeline.process, pipelines, frame_set.frames))
 
-            print("Dart detected")
-            print(f'{dart_info.multiplier}x{dart_info.base}')
 
-            if DEBUG:
-                # copy debug images
-                dbg_diff_image = diff_image.copy()
-                # draw all different corners
-                dbg_draw_corners(corners, close_corners, corners_on_line)
-                # draw darts location
-                cv2.circle(dbg_next_image, location_of_dart.astype(int), 1, color=(255, 0, 255), thickness=1)
-                cv2.circle(dbg_next_image, location_of_dart.astype(int), 20, color=(255, 0, 255), thickness=1)
-                # mark dart on test image
-                cv2.circle(dbg_diff_image, location_of_dart.astype(int), 10, color=(255, 255, 255), thickness=1, lineType=8)
-                # write debug images
-                cv2.imwrite(f'tmp/dbg_dart.jpg', dbg_diff_image)
-                cv2.imwrite(f'tmp/dbg_corners.jpg', dbg_next_image)
+def get_dart(cam: VideoStream, calibration_data: CalibrationData, token: CancellationToken) -> Optional[Dart]:
+    pipeline = DetectionPipeline(calibration_data, cam.read_frame())
 
-            return dart_info
+    for frame in frames(cam, token):
+        state = pipeline.process(frame)
+        if state == DetectionState.DART_CONFIRMED:
+            return pipeline.detection.dart
+        if state == DetectionState.PLAYER_IN_ZONE:
+            break
 
-        # missed dart
-        elif num_changed_pixels <= min_threshold:
-            if num_changed_pixels > 0:
-                print(num_changed_pixels)
-            image = next_image
-            continue
 
-        # if player enters zone - break loop
-        elif num_changed_pixels >= max_threshold:
-            print('Player entered zone')
-            print(num_changed_pixels)
-            break
+def create_pipelines(cams: CaptureGroup, calibrations: List[CalibrationData], detection_level: int = 0,
+                     tip_locators: Sequence[TipLocator] = ()) -> List[DetectionPipeline]:
+    # one locator per camera, cameras without an entry keep the corner search
+    tip_locators = list(tip_locators) + [TipLocator.CORNERS] * (len(calibrations) - len(tip_locators))
+    return [DetectionPipeline(calibration_data, frame, detection_level=detection_level, tip_locator=tip_locator)
+            for calibration_data, frame, tip_locator in zip(calibrations, cams.read_set().frames, tip_locators)]
+
+
+def get_fused_dart(cams: CaptureGroup, pipelines: List[DetectionPipeline], token: CancellationToken,
+                   executor: Optional[Executor] = None, visit: Optional[VisitTracker] = None,
+                   detections: Optional[List[Optional[DartDetection]]] = None) -> Optional[Dart]:
+    # pipelines live across darts, so the background model keeps track of darts already in the board
+    calibrations = [pipeline.calibration_data for pipeline in pipelines]
+    # detections some cameras already confirmed for this dart
+    detections = list(detections) if detections is not None else [None] * len(pipelines)
+    in_zone = [pipeline.state == DetectionState.PLAYER_IN_ZONE for pipeline in pipelines]
+    for pipeline in pipelines:
+        pipeline.attempts = 0
 
+    for frame_set in frame_sets(cams, token):
+        tracer.instant('frame_set', seqs=frame_set.seqs, skew=frame_set.skew)
+        states = process_frame_set(pipelines, frame_set, executor)
 
-def get_gray(cam: VideoStream) -> Image:
-    image = cam.read()
-    gray_image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    return gray_image
+        for idx, state in enumerate(states):
+            if state == DetectionState.DART_CONFIRMED:
+                detections[idx] = pipelines[idx].detection
+
+        if visit is not None and DetectionState.BOARD_CLEARED in states:
+            # darts pulled before the visit was complete
+            visit.reset()
+
+        # a player walking up ends the visit, one who was already at the board is waited out
+        if any(state == DetectionState.PLAYER_IN_ZONE and not was_in_zone for state, was_in_zone in zip(states, in_zone)):
+            break
+        in_zone = [state == DetectionState.PLAYER_IN_ZONE for state in states]
+
+        # fuse once every camera that saw the throw had its chance to locate it
+        if any(detections) and all(not pipeline.is_busy or pipeline.attempts for pipeline in pipelines):
+            with tracer.span('fuse', cameras=sum(map(bool, detections))):
+                dart = fuse_detections(detections, calibrations)
+            tracer.instant('dart', base=dart.base, multiplier=dart.multiplier)
+            if visit is None or visit.add(dart):
+                return dart
+            # the pipelines took the disturbed dart into their reference, wait for the next throw
+            detections = [None] * len(pipelines)
+
+
+def wait_for_board_cleared(cams: CaptureGroup, pipelines: List[DetectionPipeline], token: CancellationToken,
+                           executor: Optional[Executor] = None, visit: Optional[VisitTracker] = None,
+                           timeout: float = 10.0) -> Optional[Dart]:
+    # returns None as soon as every camera sees the empty board again, not after a fixed pause,
+    # or the first dart of the next visit if the player throws without pulling the darts
+    cleared = [False] * len(pipelines)
+    zone_since: List[Optional[float]] = [None] * len(pipelines)
+
+    for frame_set in frame_sets(cams, token):
+        states = process_frame_set(pipelines, frame_set, executor)
+
+        detections = [pipeline.detection if state == DetectionState.DART_CONFIRMED else None
+                      for pipeline, state in zip(pipelines, states)]
+        if any(detections):
+            if visit is not None:
+                visit.reset()
+            return get_fused_dart(cams, pipelines, token, executor, visit, detections)
+
+        for idx, (pipeline, state) in enumerate(zip(pipelines, states)):
+            if state == DetectionState.BOARD_CLEARED:
+                cleared[idx] = True
+            elif state == DetectionState.PLAYER_IN_ZONE:
+                if zone_since[idx] is None:
+                    zone_since[idx] = frame_set.timestamp
+            elif not cleared[idx] and state == DetectionState.IDLE and zone_since[idx] is not None \
+                    and frame_set.timestamp - zone_since[idx] >= timeout:
+                # lighting drift during the visit can keep the empty board from ever matching again
+                print('Board not cleared in time, taking a new reference')
+                pipeline.retake_reference(pipeline.previous)
+                cleared[idx] = True
+        if all(cleared):
+            return None
+    return None
+
+
+def get_gray(image: Image, roi: Optional[BoardRoi] = None) -> Image:
+    if roi is None:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    # only the board region is processed, everything outside can only produce false triggers
+    cropped_image = image[roi.y:roi.y + roi.height, roi.x:roi.x + roi.width]
+    gray_image = cv2.cvtColor(cropped_image, cv2.COLOR_RGB2GRAY)
+    return cv2.bitwise_and(gray_image, roi.mask)
 
 
 def get_binary_diff(image: Image, next_image: Image) -> Image:
@@ -136,6 +490,25 @@ def get_binary_diff(image: Image, next_image: Image) -> Image:
     return binary_diff_image
 
 
+def count_changed_pixels(image: Image, next_image: Image) -> int:
+    return cv2.countNonZero(get_binary_diff(image, next_image))
+
+
+def build_pyramid(image: Image, depth: int) -> ImagePyramid:
+    levels = [image]
+    for _ in range(depth):
+        height, width = levels[-1].shape[:2]
+        levels.append(cv2.resize(levels[-1], (width // 2, height // 2), interpolation=cv2.INTER_AREA))
+    return ImagePyramid(levels)
+
+
+def estimate_changed_pixels(image: ImagePyramid, next_image: ImagePyramid, level: int) -> int:
+    # area downsampling averages like the blur of the full diff, the lower threshold keeps the estimate on the high side
+    diff_image = cv2.absdiff(image.levels[level], next_image.levels[level])
+    _, binary_diff_image = cv2.threshold(diff_image, 30, 255, 0)
+    return cv2.countNonZero(binary_diff_image) * 4 ** level
+
+
 def get_diff(image: Image, next_image: Image) -> Image:
     diff_image = cv2.absdiff(image, next_image)
     return diff_image
@@ -151,35 +524,129 @@ def get_blurred_diff(image: Image, next_image: Image) -> Image:
     return blurred_diff_image
 
 
-def get_corners(image: Image) -> npt.NDArray[Point]:
-    corners = cv2.goodFeaturesToTrack(image, 2000, 0.0008, 1, mask=None, blockSize=3, useHarrisDetector=1, k=0.06)
+def get_corners(image: Image, mask: Optional[Image] = None) -> npt.NDArray[Point]:
+    corners = cv2.goodFeaturesToTrack(image, 2000, 0.0008, 1, mask=mask, blockSize=3, useHarrisDetector=1, k=0.06)
+    if corners is None:
+        return np.empty((0, 2), np.float32)
     corners = corners[:, 0, :]
     return corners
 
 
+def refine_location(location: Point, image: Image, next_image: Image, mask: Image, window: int,
+                    tip_locator: TipLocator = TipLocator.CORNERS, contour_threshold: int = 30, min_area: float = 100) -> Point:
+    # search the tip again at full resolution, but only in a small window around the coarse location
+    height, width = image.shape[:2]
+    x, y = location.astype(int)
+    x0, y0 = max(x - window, 0), max(y - window, 0)
+    x1, y1 = min(x + window + 1, width), min(y + window + 1, height)
+
+    diff_image = get_blurred_diff(image[y0:y1, x0:x1], next_image[y0:y1, x0:x1])
+    if tip_locator == TipLocator.CONTOUR:
+        tip = locate_tip_with_contour(diff_image, mask[y0:y1, x0:x1], contour_threshold, min_area, near=location - np.array([x0, y0]))
+        if tip is not None:
+            return tip[0] + np.array([x0, y0], np.float32)
+        # too little of the dart changed in the window for an axis, the corners may still find the tip
+
+    corners = get_corners(diff_image, mask[y0:y1, x0:x1])
+    if len(corners) == 0:
+        return location
+
+    corners_with_neighbours = filter_corners_with_neighbours(corners)
+    return get_real_location(corners_with_neighbours) + np.array([x0, y0], np.float32)
+
+
+def locate_tip_with_contour(diff_image: Image, mask: Image, threshold: int = 30, min_area: float = 0,
+                            gap: int = 25, end_share: float = 0.2, near: Optional[Point] = None,
+                            metrics: Optional[PipelineMetrics] = None) -> Optional[Tuple[Point, float]]:
+    _, binary_diff = cv2.threshold(diff_image, threshold, 255, cv2.THRESH_BINARY)
+    binary_diff = cv2.bitwise_and(binary_diff, mask)
+
+    # only the changed area and a border for the gap closing have to be labeled
+    x, y, width, height = cv2.boundingRect(binary_diff)
+    x0, y0 = max(x - gap, 0), max(y - gap, 0)
+    binary_diff = binary_diff[y0:y + height + gap, x0:x + width + gap]
+
+    # a thin shaft breaks up where it matches the board colour, so pieces closer than the gap form one blob
+    grouped = cv2.dilate(binary_diff, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (gap, gap))) if gap > 1 else binary_diff
+    num_labels, labels = cv2.connectedComponents(grouped, connectivity=8)
+    changed = binary_diff > 0
+    areas = np.bincount(labels[changed], minlength=num_labels)
+
+    # the dart is the largest changed blob
+    if num_labels < 2 or not areas[1:].any():
+        print('Dart not detected (no blob)')
+        if metrics is not None:
+            metrics.reject('no_blob')
+        return None
+    label = 1 + np.argmax(areas[1:])
+    # a blob of a few pixels has no principal axis, its covariance is degenerate
+    if areas[label] < max(min_area, 3):
+        print('Dart not detected (blob too small)', areas[label])
+        if metrics is not None:
+            metrics.reject('blob_too_small')
+        return None
+
+    ys, xs = np.nonzero(changed & (labels == label))
+    points = np.column_stack((xs + x0, ys + y0)).astype(np.float32)
+
+    # principal axis of the blob
+    mean = points.mean(axis=0)
+    eigenvalues, eigenvectors = np.linalg.eigh(np.cov(points - mean, rowvar=False))
+    axis, normal = eigenvectors[:, 1], eigenvectors[:, 0]
+    along = (points - mean) @ axis
+    across = np.abs((points - mean) @ normal)
+
+    # the flight widens one end of the blob, the other end is the tip
+    length = along.max() - along.min()
+    tail = along < along.min() + end_share * length
+    head = along > along.max() - end_share * length
+    tail_width, head_width = across[tail].mean(), across[head].mean()
+    if near is not None:
+        # refining a known tip, the blob is cut off by the window so take the end closest to it
+        tip_at_head = np.hypot(*(points[np.argmax(along)] - near)) < np.hypot(*(points[np.argmin(along)] - near))
+    elif np.isclose(tail_width, head_width):
+        # no flight visible, take the top-most end like the corner search
+        tip_at_head = points[np.argmax(along), 1] < points[np.argmin(along), 1]
+    else:
+        tip_at_head = head_width < tail_width
+    tip = points[np.argmax(along) if tip_at_head else np.argmin(along)]
+
+    # elongation of the blob, a round blob has no reliable axis
+    confidence = 1 - np.sqrt(max(eigenvalues[0], 0) / eigenvalues[1]) if eigenvalues[1] > 0 else 0.0
+    return tip, float(confidence)
+
+
 def line_frame_intersection(line: VectorLine, frame: Frame) -> Line:
 
-    def seg_intersect(line1: VectorLine, line2: VectorLine) -> Point:
+    def seg_intersect(line1: VectorLine, line2: VectorLine) -> Optional[Vec2]:
         diff = line1.support_vector - line2.support_vector
         line1_directional_vector_inv = line1.directional_vector.perp()
-        denom = np.dot(line1_directional_vector_inv, line2.directional_vector)
-        num = np.dot(line1_directional_vector_inv, diff)
-        return (num / denom.astype(float)) * line2.directional_vector + line2.support_vector
+        denom = line1_directional_vector_inv.dot(line2.directional_vector)
+        if not denom:  # parallel
+            return None
+        num = line1_directional_vector_inv.dot(diff)
+        return line2.directional_vector * (num / denom) + line2.support_vector
+
+    width, height = int(frame.width), int(frame.height)
+    line = VectorLine(Vec2.cast(line.support_vector), Vec2.cast(line.directional_vector))
 
     rect_lines = [
         # x0, y0, vx, vy
-        VectorLine(Point(0, 0), Point(1, 0)),
-        VectorLine(Point(0, frame.height - 1), Point(1, 0)),
-        VectorLine(Point(0, 0), Point(0, 1)),
-        VectorLine(Point(frame.width - 1, 0), Point(0, 1))
+        VectorLine(Vec2(0, 0), Vec2(1, 0)),
+        VectorLine(Vec2(0, height - 1), Vec2(1, 0)),
+        VectorLine(Vec2(0, 0), Vec2(0, 1)),
+        VectorLine(Vec2(width - 1, 0), Vec2(0, 1))
     ]
 
     points = []
 
     for rect_line in rect_lines:
-        point = Point.cast(seg_intersect(rect_line, line).astype(int))
-        if rect_line.directional_vector.x and 0 <= point.x < frame.width \
-                or rect_line.directional_vector.y and 0 <= point.y < frame.height:
+        intersection = seg_intersect(rect_line, line)
+        if intersection is None:
+            continue
+        point = Vec2(int(intersection.x), int(intersection.y))
+        if rect_line.directional_vector.x and 0 <= point.x < width \
+                or rect_line.directional_vector.y and 0 <= point.y < height:
             points.append(point)
 
     if len(points) > 2:
@@ -190,58 +657,48 @@ def line_frame_intersection(line: VectorLine, frame: Frame) -> Line:
     return Line(*points)
 
 
-def filter_close_corners(corners: npt.NDArray[Point]) -> npt.NDArray[Point]:
-    diff_x = 150
+def filter_close_corners(corners: npt.NDArray[Point], diff_x: float = 150,
+                         debug_image: Optional[Image] = None) -> npt.NDArray[Point]:
     mean_corners = np.mean(corners, axis=0)
     mean_x, _ = mean_corners.ravel()
 
-    left = Point(mean_x - diff_x, 0)
-    right = Point(mean_x + diff_x, 1080)
-
-    cv2.rectangle(dbg_next_image, left.astype(int), right.astype(int), color=(255, 0, 0))
+    left = (int(mean_x - diff_x), 0)
+    right = (int(mean_x + diff_x), 1080)
 
-    corners_to_filter_out = []
-    for idx, corner in enumerate(map(Point.cast, corners)):
-        # filter noise to only get dart arrow
-        if not mean_x - diff_x < corner.x < mean_x + diff_x:
-            corners_to_filter_out.append(idx)
+    if debug_image is not None:
+        cv2.rectangle(debug_image, left, right, color=(255, 0, 0))
 
-    corners_new = np.delete(corners, [corners_to_filter_out], axis=0)
+    # filter noise to only get dart arrow
+    corners_x = corners[:, 0]
+    corners_new = corners[(mean_x - diff_x < corners_x) & (corners_x < mean_x + diff_x)]
     return corners_new
 
 
-def filter_corners_on_line(corners: npt.NDArray[Point], frame: Frame) -> npt.NDArray[Point]:
-    line = cv2.fitLine(corners, cv2.DIST_WELSCH, 0, 0.1, 0.1).ravel()
-    line = VectorLine(Point.cast(line[2:]), Point.cast(line[:2]))
-    line = line_frame_intersection(line, frame)
+def filter_corners_on_line(corners: npt.NDArray[Point], frame: Frame, max_distance: float = 20,
+                           debug_image: Optional[Image] = None) -> npt.NDArray[Point]:
+    vx, vy, x0, y0 = cv2.fitLine(corners, cv2.DIST_WELSCH, 0, 0.1, 0.1).ravel().tolist()
+    line = line_frame_intersection(VectorLine(Vec2(x0, y0), Vec2(vx, vy)), frame)
 
-    corners_to_filter_out = []
-    for idx, corner in enumerate(map(Point.cast, corners)):
-        # check distance to fitted line, only draw corners within certain range
-        distance = dist(line, corner)
-        if distance > 20:
-            corners_to_filter_out.append(idx)
+    # check distance to fitted line, only keep corners within certain range
+    distances = dists(line, corners)
 
-    cv2.line(dbg_next_image, line.p1, line.p2, color=(127, 0, 127))  # debug
+    if debug_image is not None:
+        cv2.line(debug_image, tuple(line.p1), tuple(line.p2), color=(127, 0, 127))  # debug
 
-    corners_new = np.delete(corners, [corners_to_filter_out], axis=0)  # delete corners to form new array
+    corners_new = corners[distances <= max_distance]
     return corners_new
 
 
-def filter_corners_with_neighbours(corners: npt.NDArray[Point]) -> npt.NDArray[Point]:
-    loc_idx = np.argmin(corners[:, 1], axis=0)
-    loc = corners[loc_idx]
+def filter_corners_with_neighbours(corners: npt.NDArray[Point], max_gap: float = 40) -> npt.NDArray[Point]:
+    # drop top-most corners until one has at least 3 corners (itself included) within max_gap below it
+    order = np.argsort(corners[:, 1], kind='stable')
+    corners_y = corners[order, 1]
+    neighbours = np.searchsorted(corners_y, corners_y + max_gap, side='left') - np.arange(len(corners))
 
-    neighbours = 0
-    for idx, corner in enumerate(corners):
-        if corner[1] - loc[1] < 40:
-            neighbours += 1
-
-    if neighbours < 3 and len(corners) > 1:
-        print('skipped corner without neighbours')
-        return filter_corners_with_neighbours(np.delete(corners, [loc_idx], axis=0))
-    else:
-        return corners
+    num_skipped = np.argmax((neighbours >= 3) | (np.arange(len(corners)) == len(corners) - 1))
+    if num_skipped:
+        print('skipped corners without neighbours:', num_skipped)
+    return np.delete(corners, order[:num_skipped], axis=0)
 
 
 def get_real_location(corners: npt.NDArray[Point]) -> Point:
@@ -249,10 +706,11 @@ def get_real_location(corners: npt.NDArray[Point]) -> Point:
     return corners[idx]
 
 
-def dbg_draw_corners(corners: npt.NDArray[Point], close_corners: npt.NDArray[Point], corners_on_line: npt.NDArray[Point]) -> None:
+def dbg_draw_corners(image: Image, corners: npt.NDArray[Point], close_corners: npt.NDArray[Point],
+                     corners_on_line: npt.NDArray[Point]) -> None:
     for corner in corners[(corners[:, None] != close_corners).any(-1).all(1)]:
-        cv2.circle(dbg_next_image, corner.astype(int), radius=1, color=(255, 0, 0), thickness=1)  # blue
+        cv2.circle(image, corner.astype(int), radius=1, color=(255, 0, 0), thickness=1)  # blue
     for corner in close_corners:
-        cv2.circle(dbg_next_image, corner.astype(int), radius=1, color=(0, 255, 0), thickness=1)  # green
+        cv2.circle(image, corner.astype(int), radius=1, color=(0, 255, 0), thickness=1)  # green
     for corner in corners_on_line:
-        cv2.circle(dbg_next_image, corner.astype(int), radius=1, color=(0, 0, 255), thickness=1)  # red
+        cv2.circle(image, corner.astype(int), radius=1, color=(0, 0, 255), thickness=1)  # red
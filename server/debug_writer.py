@@ -0,0 +1,103 @@
+import os
+import re
+from collections import deque
+from datetime import datetime
+from queue import Full, Queue
+from threading import Lock, Thread
+from typing import Deque, Dict, List, Optional
+
+import cv2
+
+from server.classes import Image
+
+# <timestamp>_<seq>_<name>.jpg, the prefix groups the images of one detection
+debug_file_pattern = re.compile(r'^(\d{8}-\d{6}_\d{6})_\w+\.jpg$')
+
+
+class DebugWriter:
+    directory: str
+    # share of the detections whose debug images are kept, 1 keeps all of them
+    sample_rate: float
+    # sets of debug images kept on disk, older ones are deleted
+    max_files: int
+    dropped: int = 0
+    written: int = 0
+    _queue: 'Queue[Optional[Dict[str, Image]]]'
+    _files: Deque[List[str]]
+    _thread: Optional[Thread] = None
+    _lock: Lock
+    _credit: float = 0.0
+    _seq: int = 0
+
+    def __init__(self, directory: str = 'tmp/debug', sample_rate: float = 1.0, queue_size: int = 4, max_files: int = 100):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._queue = Queue(maxsize=queue_size)
+        self._files = deque()
+        self._lock = Lock()
+
+    def sample(self) -> bool:
+        # evenly spaced instead of random, so a rate of 0.25 keeps exactly every fourth detection
+        with self._lock:
+            self._credit += self.sample_rate
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            return True
+
+    def submit(self, images: Dict[str, Image]) -> bool:
+        # never blocks the detection thread, the images are dropped if the writer falls behind
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(images)
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._seed_files()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while (images := self._queue.get()) is not None:
+            self._seq += 1
+            prefix = f'{datetime.now():%Y%m%d-%H%M%S}_{self._seq:06d}'
+            paths = []
+            for name, image in images.items():
+                path = os.path.join(self.directory, f'{prefix}_{name}.jpg')
+                if cv2.imwrite(path, image):
+                    paths.append(path)
+            self.written += 1
+            self._rotate(paths)
+
+    def _seed_files(self) -> None:
+        # sets written by earlier runs count against max_files too, oldest first
+        prefixes: Dict[str, List[str]] = {}
+        for file_name in sorted(os.listdir(self.directory)):
+            match = debug_file_pattern.match(file_name)
+            if match:
+                prefixes.setdefault(match.group(1), []).append(os.path.join(self.directory, file_name))
+        self._files = deque(prefixes.values())
+        self._rotate([])
+
+    def _rotate(self, paths: List[str]) -> None:
+        if paths:
+            self._files.append(paths)
+        while len(self._files) > self.max_files:
+            for path in self._files.popleft():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
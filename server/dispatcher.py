@@ -0,0 +1,137 @@
+from collections import deque
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from server.classes import CancellationToken, OverflowPolicy
+from server.metrics import LatencyHistogram
+from server.tracing import tracer
+
+# how often idle workers and blocked publishers look at the cancellation token
+poll_interval = 0.2
+
+
+class SubscriberWorker:
+    subscriber: Callable[[Any], None]
+    name: str
+    policy: OverflowPolicy
+    max_size: int
+    lag: LatencyHistogram
+    delivered: int = 0
+    dropped: int = 0
+    failed: int = 0
+    _queue: Deque[Tuple[float, Any]]
+    _changed: Condition
+    _token: Optional[CancellationToken] = None
+    _thread: Optional[Thread] = None
+
+    def __init__(self, subscriber: Callable[[Any], None], policy: OverflowPolicy, max_size: int):
+        self.subscriber = subscriber
+        self.name = getattr(subscriber, '__name__', repr(subscriber))
+        self.policy = policy
+        self.max_size = max_size
+        self.lag = LatencyHistogram()
+        self._queue = deque()
+        self._changed = Condition()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._token is not None and self._token.is_cancelled
+
+    def start(self, token: CancellationToken) -> None:
+        if token is self._token and self._thread is not None and self._thread.is_alive():
+            return
+        # a restarted game loop comes with a new token, the previous session ends and its worker drains first
+        if self._token is not None:
+            self._token.cancel()
+        self.join()
+        self._token = token
+        self._thread = Thread(target=self._run, args=(token,), name=f'subscriber-{self.name}', daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def put(self, item: Any) -> None:
+        with self._changed:
+            if len(self._queue) >= self.max_size:
+                if self.policy == OverflowPolicy.BLOCK:
+                    while len(self._queue) >= self.max_size and not self.is_cancelled:
+                        self._changed.wait(poll_interval)
+                elif self.policy == OverflowPolicy.COALESCE:
+                    self.dropped += len(self._queue)
+                    self._queue.clear()
+                else:
+                    self.dropped += 1
+                    self._queue.popleft()
+            self._queue.append((perf_counter(), item))
+            self._changed.notify_all()
+
+    def _run(self, token: CancellationToken) -> None:
+        while True:
+            with self._changed:
+                while not self._queue and not token.is_cancelled:
+                    self._changed.wait(poll_interval)
+                if not self._queue:
+                    # cancelled and everything queued so far is delivered
+                    return
+                enqueued_at, item = self._queue.popleft()
+                self._changed.notify_all()
+
+            lag = perf_counter() - enqueued_at
+            self.lag.record(lag)
+            try:
+                with tracer.span('subscriber', subscriber=self.name, lag=lag):
+                    self.subscriber(item)
+                self.delivered += 1
+            except Exception as e:
+                # a broken subscriber must not take the others or the detection down
+                self.failed += 1
+                print(f'Subscriber {self.name} failed')
+                print(e)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'policy': self.policy.value,
+            'queued': len(self._queue),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'lag': self.lag.summary(),
+        }
+
+
+class Dispatcher:
+    # every subscriber gets its own queue and thread, publishing never waits for a subscriber unless it asked for BLOCK
+    workers: List[SubscriberWorker]
+    _token: Optional[CancellationToken] = None
+
+    def __init__(self):
+        self.workers = []
+
+    def add(self, subscriber: Callable[[Any], None], policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+            max_size: int = 64) -> SubscriberWorker:
+        worker = SubscriberWorker(subscriber, policy, max_size)
+        self.workers.append(worker)
+        if self._token is not None:
+            worker.start(self._token)
+        return worker
+
+    def start(self, token: CancellationToken) -> None:
+        self._token = token
+        for worker in self.workers:
+            worker.start(token)
+
+    def publish(self, item: Any) -> None:
+        for worker in self.workers:
+            worker.put(item)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        # workers finish once the token is cancelled and their queues are drained
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        return [worker.get_metrics() for worker in self.workers]
@@ -0,0 +1,38 @@
+from collections import deque
+from itertools import islice
+from threading import Condition
+from typing import Any, Deque, Dict, List, Optional
+
+
+class EventLog:
+    # append only, readers keep their own cursor so nobody takes events away from the others
+    _events: Deque[Dict[str, Any]]
+    _changed: Condition
+    last_id: int = 0
+
+    def __init__(self, capacity: int = 10_000):
+        # only the latest events are retained, ids keep counting
+        self._events = deque(maxlen=capacity)
+        self._changed = Condition()
+
+    def append(self, data: Dict[str, Any]) -> int:
+        with self._changed:
+            self.last_id += 1
+            self._events.append({'id': self.last_id, **data})
+            self._changed.notify_all()
+            return self.last_id
+
+    def since(self, event_id: int) -> List[Dict[str, Any]]:
+        with self._changed:
+            return self._since(event_id)
+
+    def wait(self, event_id: int, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        # long poll: returns as soon as there is an event newer than event_id, empty after the timeout
+        with self._changed:
+            self._changed.wait_for(lambda: self.last_id > event_id, timeout)
+            return self._since(event_id)
+
+    def _since(self, event_id: int) -> List[Dict[str, Any]]:
+        # ids are consecutive, so the position in the buffer follows from the id
+        first_id = self.last_id - len(self._events) + 1
+        return list(islice(self._events, max(event_id - first_id + 1, 0), None))
@@ -0,0 +1,120 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from time import monotonic, sleep
+from typing import List, Optional, Tuple, Union
+
+import cv2
+
+from server.classes import Image
+
+
+class FrameSource(ABC):
+    # live sources drop frames when consumers fall behind, recorded ones wait for them
+    is_live: bool = True
+
+    @abstractmethod
+    def read(self) -> Tuple[bool, Optional[Image], float]:
+        pass
+
+    @abstractmethod
+    def release(self) -> None:
+        pass
+
+
+class CameraSource(FrameSource):
+    _capture: cv2.VideoCapture
+
+    def __init__(self, src: Union[int, str] = 0):
+        self._capture = cv2.VideoCapture(src)
+
+    def read(self) -> Tuple[bool, Optional[Image], float]:
+        success, frame = self._capture.read()
+        if not success:
+            return False, None, monotonic()
+        return True, cv2.flip(frame, flipCode=-1), monotonic()
+
+    def release(self) -> None:
+        self._capture.release()
+
+
+class ReplaySource(FrameSource):
+    _capture: Optional[cv2.VideoCapture] = None
+    _image_files: List[str]
+    _index: int = 0
+    _count: int = 0
+    _started_at: Optional[float] = None
+    fps: float
+    realtime: bool
+    loop: bool
+    flip: bool
+
+    def __init__(self, path: str, fps: Optional[float] = None, realtime: bool = True, loop: bool = False, flip: bool = False):
+        if os.path.isdir(path):
+            self._image_files = sorted((os.path.join(path, f) for f in os.listdir(path) if is_image_file(f)), key=natural_sort_key)
+            if not self._image_files:
+                raise FileNotFoundError(f'No images found in {path}')
+        else:
+            self._capture = cv2.VideoCapture(path)
+            if not self._capture.isOpened():
+                raise FileNotFoundError(f'Could not open {path}')
+            self._image_files = []
+            fps = fps or self._capture.get(cv2.CAP_PROP_FPS)
+
+        self.fps = fps or 30.0
+        self.realtime = realtime
+        self.is_live = realtime
+        self.loop = loop
+        self.flip = flip
+
+    def read(self) -> Tuple[bool, Optional[Image], float]:
+        frame = self._next_frame()
+        if frame is None and self.loop and self._index > 0:
+            self._rewind()
+            frame = self._next_frame()
+        if frame is None:
+            return False, None, self._timestamp()
+
+        # timestamps follow the recording, so replays are reproducible independent of pacing
+        timestamp = self._timestamp()
+        self._index += 1
+        self._count += 1
+
+        if self.realtime:
+            if self._started_at is None:
+                self._started_at = monotonic() - timestamp
+            delay = self._started_at + timestamp - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+        if self.flip:
+            frame = cv2.flip(frame, flipCode=-1)
+        return True, frame, timestamp
+
+    def release(self) -> None:
+        if self._capture is not None:
+            self._capture.release()
+
+    def _next_frame(self) -> Optional[Image]:
+        if self._capture is not None:
+            success, frame = self._capture.read()
+            return frame if success else None
+        if self._index >= len(self._image_files):
+            return None
+        return cv2.imread(self._image_files[self._index])
+
+    def _rewind(self) -> None:
+        if self._capture is not None:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._index = 0
+
+    def _timestamp(self) -> float:
+        return self._count / self.fps
+
+
+def is_image_file(file_name: str) -> bool:
+    return os.path.splitext(file_name)[1].lower() in ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def natural_sort_key(file_name: str) -> List[Union[int, str]]:
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', file_name)]
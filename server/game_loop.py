@@ -1,54 +1,98 @@
-import csv
-import os
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from time import sleep
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 
 from server.calibration import read_calibration_data
-from server.classes import CalibrationData, CancellationToken, Dart
-from server.darts_recognition import get_dart
-from server.video_capture import VideoStream
+from server.classes import CalibrationData, CancellationToken, Dart, OverflowPolicy, TipLocator
+from server.dart_log import DartLogWriter, dart_row
+from server.dart_store import DartStore, open_dart_log
+from server.darts_recognition import DetectionPipeline, create_pipelines, get_fused_dart, wait_for_board_cleared
+from server.dispatcher import Dispatcher
+from server.frame_sources import FrameSource
+from server.tracing import tracer
+from server.video_capture import CaptureGroup
+from server.visit_tracker import VisitTracker
 
 
 class GameLoop:
-    cam: VideoStream = VideoStream(src=1)
-    calibration_data: CalibrationData = read_calibration_data('../tmp/calibration_data.pkl')
+    cams: CaptureGroup
+    calibrations: List[CalibrationData]
+    pipelines: List[DetectionPipeline]
+    visit: VisitTracker
+    executor: ThreadPoolExecutor
+    detection_level: int
+    tip_locators: Sequence[TipLocator]
     cancellationToken: CancellationToken
-    subscribers: List[Callable[[Dart], None]] = []
+    dispatcher: Dispatcher
+    dart_log: Union[DartLogWriter, DartStore]
 
-    def __init__(self):
-        self.subscribers.append(log_dart)
+    def __init__(self, srcs: Sequence[Union[int, str, FrameSource]] = (1,),
+                 calibration_files: Sequence[str] = ('../tmp/calibration_data.pkl',), detection_level: int = 0,
+                 tip_locators: Sequence[TipLocator] = (), dart_log_file: str = '../tmp/darts_log2.csv'):
+        if len(srcs) != len(calibration_files):
+            raise ValueError('Every camera needs its own calibration file')
+        self.cams = CaptureGroup(srcs)
+        self.calibrations = [read_calibration_data(calibration_file) for calibration_file in calibration_files]
+        self.executor = ThreadPoolExecutor(max_workers=len(srcs))
+        self.detection_level = detection_level
+        self.tip_locators = tip_locators
+        self.dispatcher = Dispatcher()
+        # a .db file keeps the darts in an indexed sqlite store instead of the csv log
+        self.dart_log = open_dart_log(dart_log_file)
+        # the log must not lose rows, a stalled disk rather holds up detection
+        self.dispatcher.add(self.log_dart, OverflowPolicy.BLOCK, max_size=256)
 
-    def add_subscriber(self, subscriber: Callable[[Dart], None]) -> None:
-        self.subscribers.append(subscriber)
+    def add_subscriber(self, subscriber: Callable[[Dart], None], policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                       max_size: int = 64) -> None:
+        self.dispatcher.add(subscriber, policy, max_size)
 
     def start(self) -> None:
         self.cancellationToken = CancellationToken()
-        self.cam.start(); sleep(1)
+        self.dispatcher.start(self.cancellationToken)
+        self.cams.start(); sleep(1)
+        self.pipelines = create_pipelines(self.cams, self.calibrations, self.detection_level, self.tip_locators)
+        self.visit = VisitTracker(self.calibrations[0])
         print('start')
         Thread(target=self.run, daemon=True).start()
 
-    def stop(self) -> None:
+    def stop(self, timeout: Optional[float] = None) -> None:
         self.cancellationToken.cancel()
+        # darts already handed out are still delivered
+        self.dispatcher.join(timeout)
+        self.dart_log.close()
 
-    def run(self) -> None:
-        while not self.cancellationToken.is_cancelled:
-            dart = get_dart(self.cam, self.calibration_data, self.cancellationToken)
-            [subscriber(dart) for subscriber in self.subscribers]
-            if not dart: sleep(5)
-
+    def log_dart(self, dart: Dart) -> None:
+        if dart: self.dart_log.write(dart_row(dart))
 
-def log_dart(dart: Dart) -> None:
-    darts_log = '../tmp/darts_log2.csv'
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'cameras': [pipeline.metrics.snapshot() for pipeline in self.pipelines],
+            'dropped_frames': list(self.cams.dropped_frames),
+            'skipped_frames': list(self.cams.skipped_frames),
+            'subscribers': self.dispatcher.get_metrics(),
+        }
 
-    def write_csv(dart_dict: Dict[str, Any], header: bool = False):
-        field_names: List[str] = ['id', 'date', 'base', 'multiplier', 'loc_x', 'loc_y']
-        with open(darts_log, 'a') as csv_file:
-            csv_writer = csv.DictWriter(csv_file, field_names)
-            if header: csv_writer.writeheader()
-            csv_writer.writerows([dart_dict])
-
-    if dart: write_csv(dart.asdict(), header=(not os.path.isfile(darts_log)))
+    def run(self) -> None:
+        while not self.cancellationToken.is_cancelled:
+            with tracer.span('get_fused_dart'):
+                dart = get_fused_dart(self.cams, self.pipelines, self.cancellationToken, self.executor, self.visit)
+            if self.cancellationToken.is_cancelled:
+                break
+            if dart is None and self.cams.stopped:
+                # a replay ended or a camera failed, no more darts will come
+                print('Cameras stopped, game loop ends')
+                break
+            # subscribers run on their own threads, a slow one no longer delays the next dart
+            self.dispatcher.publish(dart)
+            if self.visit.is_complete:
+                with tracer.span('wait_for_board_cleared'):
+                    dart = wait_for_board_cleared(self.cams, self.pipelines, self.cancellationToken, self.executor, self.visit)
+                if dart is None:
+                    self.visit.reset()
+                else:
+                    # thrown before the darts were pulled, it opens the next visit
+                    self.dispatcher.publish(dart)
 
 
 if __name__ == '__main__':
@@ -12,6 +12,8 @@ def dist(line: Line, point: Point) -> float:
     py = line.p2.y - line.p1.y
 
     squared_dist = px**2 + py**2
+    if not squared_dist:  # zero length line
+        return math.hypot(point.x - line.p1.x, point.y - line.p1.y)
 
     u = ((point.x - line.p1.x) * px + (point.y - line.p1.y) * py) / float(squared_dist)
 
@@ -36,11 +38,63 @@ def dist(line: Line, point: Point) -> float:
     return distance
 
 
+# distances of an array of points to line
+def dists(line: Line, points: np.ndarray) -> np.ndarray:
+    return segment_dists(points, as_lines(line))[:, 0]
+
+
+# (M, 2, 2) array of [p1, p2] from a Line, a list of Lines or an array of segments
+def as_lines(lines) -> np.ndarray:
+    if isinstance(lines, Line):
+        lines = [lines]
+    if len(lines) and isinstance(lines[0], Line):
+        lines = [(line.p1, line.p2) for line in lines]
+    return np.asarray(lines, dtype=float).reshape(-1, 2, 2)
+
+
+# (K, 3) array of [x, y, r] from a Circle, a list of Circles or an array of circles
+def as_circles(circles) -> np.ndarray:
+    if isinstance(circles, Circle):
+        circles = [circles]
+    if len(circles) and isinstance(circles[0], Circle):
+        circles = [(circle.x, circle.y, circle.r) for circle in circles]
+    return np.asarray(circles, dtype=float).reshape(-1, 3)
+
+
+# projection parameters (N, M) of points onto the lines, 0 for zero length lines
+def projections(points: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    lines = as_lines(lines)
+    p1 = lines[:, 0]
+    n = lines[:, 1] - p1
+    v = np.asarray(points, dtype=float).reshape(-1, 1, 2) - p1
+
+    squared_length = np.einsum('mi,mi->m', n, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = np.einsum('nmi,mi->nm', v, n) / squared_length
+    return np.where(squared_length > 0, u, 0)
+
+
+# distances (N, M) of N points to M segments, zero length segments fall back to point distance
+def segment_dists(points: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(closest_points(points, lines, clamp=True) - np.asarray(points, dtype=float).reshape(-1, 1, 2), axis=-1)
+
+
+# closest points (N, M, 2) of N points on M lines, clamped to the segments if requested
+def closest_points(points: np.ndarray, lines: np.ndarray, clamp: bool = False) -> np.ndarray:
+    lines = as_lines(lines)
+    u = projections(points, lines)
+    if clamp:
+        u = np.clip(u, 0, 1)
+    return lines[:, 0] + u[..., None] * (lines[:, 1] - lines[:, 0])
+
+
 # closest point on line to point
 def closest_point(line: Line, point: Point) -> Point:
 
     n = line.p2 - line.p1
     v = point - line.p1
+    if not np.dot(n, n):  # zero length line
+        return line.p1
 
     z = line.p1 + n * (np.dot(v, n) / np.dot(n, n))
 
@@ -54,6 +108,8 @@ def intersect_line_circle(circle: Circle, line: Line) -> (bool, Optional[Point],
     caY = circle.y - line.p1.y
 
     a = baX**2 + baY**2
+    if not a:  # zero length line
+        return False, None, False, None
     bBy2 = baX * caX + baY * caY
     c = caX**2 + caY**2 - circle.r**2
 
@@ -74,3 +130,46 @@ def intersect_line_circle(circle: Circle, line: Line) -> (bool, Optional[Point],
 
     pint2 = Point(line.p1.x - baX * ab_scaling_factor2, line.p1.y - baY * ab_scaling_factor2)
     return True, pint1, True, pint2
+
+
+# intersections (M, K, 2, 2) of M lines with K circles, NaN where a line misses a circle or has zero length
+def intersect_lines_circles(lines: np.ndarray, circles: np.ndarray) -> np.ndarray:
+    lines = as_lines(lines)
+    circles = as_circles(circles)
+
+    p1 = lines[:, None, 0]
+    ba = lines[:, None, 1] - p1
+    ca = circles[None, :, :2] - p1
+
+    a = np.einsum('mki,mki->mk', ba, ba)
+    b_by2 = np.einsum('mki,mki->mk', ba, ca)
+    c = np.einsum('mki,mki->mk', ca, ca) - circles[None, :, 2]**2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_by2 = b_by2 / a
+        disc = p_by2**2 - c / a
+        tmp_sqrt = np.sqrt(np.where((a > 0) & (disc >= 0), disc, np.nan))
+
+    # same order as intersect_line_circle
+    t = p_by2[..., None] + np.stack((-tmp_sqrt, tmp_sqrt), axis=-1)
+    return p1[..., None, :] + t[..., None] * ba[..., None, :]
+
+
+# z component of the cross product of arrays of 2d vectors
+def cross(v: np.ndarray, w: np.ndarray) -> np.ndarray:
+    return v[..., 0] * w[..., 1] - v[..., 1] * w[..., 0]
+
+
+# intersections (M, 2) of pairs of infinite lines, NaN for parallel or zero length lines
+def intersect_lines(lines1: np.ndarray, lines2: np.ndarray) -> np.ndarray:
+    lines1 = as_lines(lines1)
+    lines2 = as_lines(lines2)
+
+    d1 = lines1[:, 1] - lines1[:, 0]
+    d2 = lines2[:, 1] - lines2[:, 0]
+    diff = lines2[:, 0] - lines1[:, 0]
+
+    denom = cross(d1, d2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(denom != 0, cross(diff, d2) / denom, np.nan)
+    return lines1[:, 0] + t[:, None] * d1
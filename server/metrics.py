@@ -0,0 +1,83 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Deque, Dict, Iterator, List
+
+import numpy as np
+
+from server.tracing import tracer
+
+# upper bucket bounds in seconds, 100 us to 10 s
+histogram_buckets: List[float] = [b * 10 ** e for e in range(-4, 1) for b in (1, 2, 5)] + [10.0]
+
+
+class LatencyHistogram:
+    samples: Deque[float]
+    count: int = 0
+
+    def __init__(self, window: int = 1000):
+        # only the latest samples count, so the figures follow the current load
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        samples = np.array(self.samples)
+        if not len(samples):
+            return {'count': self.count}
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        bucket_counts = np.histogram(samples, [0.0] + histogram_buckets + [np.inf])[0]
+        return {
+            'count': self.count,
+            'mean': float(samples.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': float(samples.max()),
+            'buckets': {f'{bound:g}': int(count) for bound, count in zip(histogram_buckets + [np.inf], bucket_counts)},
+        }
+
+
+class PipelineMetrics:
+    histograms: Dict[str, LatencyHistogram]
+    rejections: Counter
+    window: int
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self.histograms = {}
+        self.rejections = Counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram(self.window)
+        histogram.record(seconds)
+
+    @contextmanager
+    def time(self, stage: str, **args: Any) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start
+            self.record(stage, duration)
+            # stage timings double as trace spans while tracing is on
+            if tracer.enabled:
+                tracer.complete(stage, start, duration, **args)
+
+    def reject(self, reason: str) -> None:
+        self.rejections[reason] += 1
+        tracer.instant('reject', reason=reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        # only the pipeline's thread writes, readers work on copies
+        return {
+            'stages': {stage: histogram.summary() for stage, histogram in list(self.histograms.items())},
+            'rejections': dict(self.rejections),
+        }
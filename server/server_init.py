@@ -1,23 +1,24 @@
-from typing import List
-
 from server import api
-from server.classes import Dart
+from server.classes import OverflowPolicy
+from server.event_log import EventLog
 from server.game_loop import GameLoop
 
-latest_darts: List[Dart] = []
+dart_events: EventLog = EventLog()
 
 
-def setup_game_loop():
+def setup_game_loop() -> GameLoop:
     game_loop = GameLoop()
-    game_loop.add_subscriber(lambda d: latest_darts.append(d))
+    game_loop.add_subscriber(lambda d: dart_events.append({'dart': d.asjson() if d else None}), OverflowPolicy.BLOCK)
     game_loop.start()
+    return game_loop
 
 
-def setup_api_app():
-    api.get_darts = lambda: [latest_darts.pop() for _ in range(len(latest_darts))]
-    api.app.run(host='0.0.0.0', port=8000)
+def setup_api_app(game_loop: GameLoop):
+    api.dart_events = dart_events
+    api.get_metrics = game_loop.get_metrics
+    # long polls and event streams hold a thread each
+    api.app.run(host='0.0.0.0', port=8000, threaded=True)
 
 
 if __name__ == '__main__':
-    setup_game_loop()
-    setup_api_app()
+    setup_api_app(setup_game_loop())
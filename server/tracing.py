@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Deque, Dict, Iterator, List
+
+
+class Tracer:
+    # off by default, a disabled tracer costs one attribute check per span
+    enabled: bool = False
+    events: Deque[Dict[str, Any]]
+    thread_names: Dict[int, str]
+
+    def __init__(self, capacity: int = 100_000):
+        # ring buffer, the oldest events are overwritten once it is full
+        self.events = deque(maxlen=capacity)
+        self.thread_names = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        self.events.clear()
+
+    def complete(self, name: str, start: float, duration: float, **args: Any) -> None:
+        self._append({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'args': args})
+
+    def instant(self, name: str, **args: Any) -> None:
+        if self.enabled:
+            self._append({'name': name, 'ph': 'i', 's': 't', 'ts': perf_counter() * 1e6, 'args': args})
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, perf_counter() - start, **args)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        # trace event format, loads in chrome://tracing and ui.perfetto.dev
+        pid = os.getpid()
+        thread_events: List[Dict[str, Any]] = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        return {'traceEvents': thread_events + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_chrome_trace(), default=json_value)
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w') as trace_file:
+            trace_file.write(self.to_json())
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event['pid'] = os.getpid()
+        event['tid'] = tid
+        self.events.append(event)
+
+
+def json_value(value: Any) -> Any:
+    # numpy scalars end up in span arguments, e.g. dart bases from the lookup table
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+tracer = Tracer()
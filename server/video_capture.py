@@ -1,32 +1,153 @@
-from threading import Thread
+from collections import deque
+from threading import Condition, Thread
+from time import monotonic
+from typing import Deque, List, Optional, Sequence, Union
 
-import cv2
-
-from server.classes import Image
+from server.classes import CapturedFrame, FrameSet, Image
+from server.frame_sources import CameraSource, FrameSource
 
 
 class VideoStream:
-    _stream: cv2.VideoCapture
-    frame: Image
+    _source: FrameSource
+    _buffer: Deque[CapturedFrame]
+    _new_frame: Condition
+    _seq: int = 0
+    _consumed_seq: int = -1
     stopped: bool = False
 
-    def __init__(self, src: int = 0):
-        self._stream = cv2.VideoCapture(src)
-        _, frame = self._stream.read()
-        self.frame = cv2.flip(frame, flipCode=-1)
+    def __init__(self, src: Union[int, str, FrameSource] = 0, buffer_size: int = 32):
+        self._source = src if isinstance(src, FrameSource) else CameraSource(src)
+        self._buffer = deque(maxlen=buffer_size)
+        self._new_frame = Condition()
+        success, frame, timestamp = self._source.read()
+        if not success:
+            raise IOError(f'Could not read from {src}')
+        self._push(frame, timestamp)
+
+    @property
+    def frame(self) -> Image:
+        return self._buffer[-1].image
 
     def start(self) -> None:
         self.stopped = False
         Thread(target=self._record).start()
 
     def stop(self) -> None:
-        self.stopped = True
+        with self._new_frame:
+            self.stopped = True
+            self._new_frame.notify_all()
 
     def read(self) -> Image:
         return self.frame
 
+    def read_frame(self) -> CapturedFrame:
+        with self._new_frame:
+            frame = self._buffer[-1]
+            if not self._source.is_live:
+                # recorded sources continue where the last consumer stopped
+                frame = next((f for f in self._buffer if f.seq > self._consumed_seq), frame)
+            self._consume(frame)
+            return frame
+
+    def wait_for_frame(self, after_seq: int, timeout: Optional[float] = None) -> Optional[CapturedFrame]:
+        # returns the oldest buffered frame newer than after_seq, so consumers see every frame exactly once
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._buffer[-1].seq > after_seq or self.stopped, timeout)
+            for frame in self._buffer:
+                if frame.seq > after_seq:
+                    self._consume(frame)
+                    return frame
+            return None
+
+    def frames_after(self, after_seq: int, timeout: Optional[float] = None) -> List[CapturedFrame]:
+        # like wait_for_frame, but returns all newer buffered frames without consuming them
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._buffer[-1].seq > after_seq or self.stopped, timeout)
+            return [frame for frame in self._buffer if frame.seq > after_seq]
+
+    def mark_consumed(self, frame: CapturedFrame) -> None:
+        with self._new_frame:
+            self._consume(frame)
+
+    def _consume(self, frame: CapturedFrame) -> None:
+        if frame.seq > self._consumed_seq:
+            self._consumed_seq = frame.seq
+            self._new_frame.notify_all()
+
+    def _push(self, frame: Image, timestamp: float) -> None:
+        with self._new_frame:
+            if not self._source.is_live:
+                # recorded sources must not overwrite frames nobody has seen yet
+                self._new_frame.wait_for(lambda: self._seq - self._consumed_seq <= self._buffer.maxlen or self.stopped)
+            self._buffer.append(CapturedFrame(self._seq, timestamp, frame))
+            self._seq += 1
+            self._new_frame.notify_all()
+
     def _record(self) -> None:
         while not self.stopped:
-            _, frame = self._stream.read()
-            self.frame = cv2.flip(frame, flipCode=-1)
-        self._stream.release()
+            success, frame, timestamp = self._source.read()
+            if not success:
+                self.stop()
+                break
+            self._push(frame, timestamp)
+        self._source.release()
+
+
+class CaptureGroup:
+    streams: List[VideoStream]
+    max_skew: float
+    # frames discarded because no other camera had a frame close enough in time
+    dropped_frames: List[int]
+    # frames overwritten in a stream's buffer before the group got to them
+    skipped_frames: List[int]
+
+    def __init__(self, srcs: Sequence[Union[int, str, FrameSource]], max_skew: float = 1 / 60, buffer_size: int = 32):
+        self.streams = [VideoStream(src, buffer_size=buffer_size) for src in srcs]
+        self.max_skew = max_skew
+        self.dropped_frames = [0] * len(self.streams)
+        self.skipped_frames = [0] * len(self.streams)
+
+    @property
+    def stopped(self) -> bool:
+        return any(stream.stopped for stream in self.streams)
+
+    def start(self) -> None:
+        # every stream records on its own thread, so camera reads never wait on each other
+        for stream in self.streams:
+            stream.start()
+
+    def stop(self) -> None:
+        for stream in self.streams:
+            stream.stop()
+
+    def read_set(self) -> FrameSet:
+        return FrameSet([stream.read_frame() for stream in self.streams])
+
+    def wait_for_set(self, after: FrameSet, timeout: Optional[float] = None) -> Optional[FrameSet]:
+        deadline = None if timeout is None else monotonic() + timeout
+        cursors = after.seqs
+        pending: List[List[CapturedFrame]] = [[] for _ in self.streams]
+
+        while True:
+            # make sure every camera has at least one candidate frame
+            for idx, stream in enumerate(self.streams):
+                if pending[idx]:
+                    continue
+                remaining = None if deadline is None else max(deadline - monotonic(), 0)
+                pending[idx] = stream.frames_after(cursors[idx], remaining)
+                if not pending[idx]:
+                    return None
+                self.skipped_frames[idx] += pending[idx][0].seq - cursors[idx] - 1
+                cursors[idx] = pending[idx][-1].seq
+
+            heads = [frames[0] for frames in pending]
+            timestamps = [frame.timestamp for frame in heads]
+            if max(timestamps) - min(timestamps) <= self.max_skew:
+                for stream, frame in zip(self.streams, heads):
+                    stream.mark_consumed(frame)
+                return FrameSet(heads)
+
+            # the oldest head cannot be matched by the other cameras anymore
+            oldest = timestamps.index(min(timestamps))
+            self.streams[oldest].mark_consumed(pending[oldest].pop(0))
+            self.dropped_frames[oldest] += 1
@@ -0,0 +1,43 @@
+from typing import List, Optional
+
+import numpy as np
+
+from server.classes import CalibrationData, Dart
+
+# two darts closer than this, relative to the outer double ring radius (~5 mm), are the same dart
+duplicate_distance = 0.03
+
+
+class VisitTracker:
+    calibration_data: CalibrationData
+    darts: List[Dart]
+    max_darts: int
+
+    def __init__(self, calibration_data: CalibrationData, max_darts: int = 3):
+        self.calibration_data = calibration_data
+        self.max_darts = max_darts
+        self.darts = []
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.darts) >= self.max_darts
+
+    def reset(self) -> None:
+        self.darts = []
+
+    def find(self, dart: Dart) -> Optional[Dart]:
+        # a dart that was knocked or occluded by the next one shows up again at its old location
+        for scored_dart in self.darts:
+            if np.hypot(*(dart.location - scored_dart.location)) <= duplicate_distance * self.calibration_data.ring_radii[5]:
+                return scored_dart
+        return None
+
+    def add(self, dart: Dart) -> bool:
+        if self.is_complete:
+            print('Visit already complete')
+            return False
+        if self.find(dart) is not None:
+            print('Dart already scored')
+            return False
+        self.darts.append(dart)
+        return True
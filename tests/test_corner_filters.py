@@ -0,0 +1,88 @@
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+from server.benchmark import point_line_frame_intersection
+from server.classes import Frame, Line, Point, VectorLine
+from server.darts_recognition import filter_close_corners, filter_corners_on_line, filter_corners_with_neighbours
+
+frame = Frame(1280, 720)
+
+
+# scalar implementations the vectorized filters replaced, with the Point based intersection and dist from before
+def scalar_dist(line: Line, point: Point) -> float:
+    px = line.p2.x - line.p1.x
+    py = line.p2.y - line.p1.y
+    u = min(max(((point.x - line.p1.x) * px + (point.y - line.p1.y) * py) / float(px**2 + py**2), 0), 1)
+    return math.sqrt((line.p1.x + u * px - point.x)**2 + (line.p1.y + u * py - point.y)**2)
+
+
+def scalar_filter_close_corners(corners, diff_x=150):
+    mean_x = np.mean(corners, axis=0).ravel()[0]
+    corners_to_filter_out = []
+    for idx, corner in enumerate(map(Point.cast, corners)):
+        if not mean_x - diff_x < corner.x < mean_x + diff_x:
+            corners_to_filter_out.append(idx)
+    return np.delete(corners, [corners_to_filter_out], axis=0)
+
+
+def scalar_filter_corners_on_line(corners, max_distance=20):
+    vx, vy, x0, y0 = cv2.fitLine(corners, cv2.DIST_WELSCH, 0, 0.1, 0.1).ravel().tolist()
+    # an axis parallel line divides by zero for the parallel frame edges, which then fail the range check
+    with np.errstate(divide='ignore', invalid='ignore'):
+        line = point_line_frame_intersection(VectorLine(Point(x0, y0), Point(vx, vy)), frame)
+    corners_to_filter_out = []
+    for idx, corner in enumerate(map(Point.cast, corners)):
+        if scalar_dist(line, corner) > max_distance:
+            corners_to_filter_out.append(idx)
+    return np.delete(corners, [corners_to_filter_out], axis=0)
+
+
+def scalar_filter_corners_with_neighbours(corners, max_gap=40):
+    loc_idx = np.argmin(corners[:, 1], axis=0)
+    loc = corners[loc_idx]
+    neighbours = 0
+    for corner in corners:
+        if corner[1] - loc[1] < max_gap:
+            neighbours += 1
+    if neighbours < 3 and len(corners) > 1:
+        return scalar_filter_corners_with_neighbours(np.delete(corners, [loc_idx], axis=0), max_gap)
+    return corners
+
+
+def random_corners(seed: int) -> np.ndarray:
+    # a dart like streak of corners plus scattered noise, on the integer grid goodFeaturesToTrack mostly returns
+    rng = np.random.default_rng(seed)
+    start = rng.uniform((200, 100), (1000, 300))
+    direction = rng.uniform((-0.5, 0.5), (0.5, 1.0))
+    streak = start + rng.uniform(0, 300, (rng.integers(5, 60), 1)) * direction + rng.normal(0, 4, (1, 2))
+    noise = rng.uniform((0, 0), (1279, 719), (rng.integers(0, 40), 2))
+    corners = np.concatenate((streak, noise))
+    if seed % 2:
+        corners = np.round(corners)
+    return rng.permutation(corners).astype(np.float32)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_filter_close_corners(seed):
+    corners = random_corners(seed)
+    np.testing.assert_array_equal(filter_close_corners(corners), scalar_filter_close_corners(corners))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_filter_corners_on_line(seed):
+    corners = random_corners(seed)
+    np.testing.assert_array_equal(filter_corners_on_line(corners, frame), scalar_filter_corners_on_line(corners))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_filter_corners_with_neighbours(seed):
+    corners = random_corners(seed)
+    np.testing.assert_array_equal(filter_corners_with_neighbours(corners), scalar_filter_corners_with_neighbours(corners))
+
+
+def test_filter_corners_with_neighbours_keeps_last_corner():
+    corners = np.array([[10, 0], [10, 100], [10, 200]], dtype=np.float32)
+    np.testing.assert_array_equal(filter_corners_with_neighbours(corners), scalar_filter_corners_with_neighbours(corners))
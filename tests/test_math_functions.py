@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from server.classes import Circle, Line, Point
+from server.math_functions import as_lines, closest_point, closest_points, dist, dists, intersect_line_circle, intersect_lines, intersect_lines_circles, segment_dists
+
+
+def random_lines(rng: np.random.Generator, count: int):
+    lines = [Line(Point(*rng.uniform(-100, 100, 2)), Point(*rng.uniform(-100, 100, 2))) for _ in range(count)]
+    # zero length segments, which the scalar version handles as point distance
+    lines += [Line(Point(x, y), Point(x, y)) for x, y in rng.uniform(-100, 100, (count // 4 + 1, 2))]
+    return lines
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_dists_matches_dist(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-150, 150, (200, 2))
+    for line in random_lines(rng, 8):
+        expected = [dist(line, Point(*point)) for point in points]
+        np.testing.assert_allclose(dists(line, points), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_dists_accepts_float32_corners():
+    line = Line(Point(0, 0), Point(10, 0))
+    corners = np.array([[5, 3], [-4, 3], [13, -4]], dtype=np.float32)
+    np.testing.assert_allclose(dists(line, corners), [3, 5, 5])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_segment_dists_matches_dist(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-150, 150, (50, 2))
+    lines = random_lines(rng, 12)
+    expected = [[dist(line, Point(*point)) for line in lines] for point in points]
+    np.testing.assert_allclose(segment_dists(points, as_lines(lines)), expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_closest_points_matches_closest_point(seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-150, 150, (30, 2))
+    lines = random_lines(rng, 6)
+    expected = [[closest_point(line, Point(*point)) for line in lines] for point in points]
+    np.testing.assert_allclose(closest_points(points, lines), expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_intersect_lines_circles_matches_intersect_line_circle(seed):
+    rng = np.random.default_rng(seed)
+    lines = random_lines(rng, 8)
+    circles = [Circle(*rng.uniform(-50, 50, 2), r) for r in rng.uniform(1, 120, 6)]
+    intersections = intersect_lines_circles(lines, circles)
+    assert intersections.shape == (len(lines), len(circles), 2, 2)
+
+    for m, line in enumerate(lines):
+        for k, circle in enumerate(circles):
+            hit1, point1, hit2, point2 = intersect_line_circle(circle, line)
+            if hit1:
+                np.testing.assert_allclose(intersections[m, k, 0], point1, rtol=1e-9, atol=1e-9)
+            else:
+                assert np.isnan(intersections[m, k, 0]).all()
+            if hit2:
+                np.testing.assert_allclose(intersections[m, k, 1], point2, rtol=1e-9, atol=1e-9)
+
+
+def test_intersect_lines_circles_tangent_and_miss():
+    line = Line(Point(-10, 5), Point(10, 5))
+    intersections = intersect_lines_circles(line, [Circle(0, 0, 5), Circle(0, 0, 4), Circle(0, 0, 13)])
+    np.testing.assert_allclose(intersections[0, 0], [[0, 5], [0, 5]])
+    assert np.isnan(intersections[0, 1]).all()
+    np.testing.assert_allclose(intersections[0, 2], [[-12, 5], [12, 5]])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_intersect_lines(seed):
+    rng = np.random.default_rng(seed)
+    lines1 = rng.uniform(-100, 100, (40, 2, 2))
+    lines2 = rng.uniform(-100, 100, (40, 2, 2))
+    intersections = intersect_lines(lines1, lines2)
+
+    for (a, b), (c, d), intersection in zip(lines1, lines2, intersections):
+        # scalar reference by Cramer's rule
+        matrix = np.array([b - a, c - d]).T
+        t, _ = np.linalg.solve(matrix, c - a)
+        np.testing.assert_allclose(intersection, a + t * (b - a), rtol=1e-7, atol=1e-7)
+
+
+def test_intersect_lines_parallel_and_zero_length():
+    lines1 = [[[0, 0], [1, 0]], [[0, 0], [0, 0]], [[0, 0], [1, 1]]]
+    lines2 = [[[0, 1], [5, 1]], [[0, 1], [5, 1]], [[0, 2], [2, 0]]]
+    intersections = intersect_lines(lines1, lines2)
+    assert np.isnan(intersections[:2]).all()
+    np.testing.assert_allclose(intersections[2], [1, 1])